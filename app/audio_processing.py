@@ -0,0 +1,362 @@
+"""
+Vectorized post-processing for synthesized speech.
+
+Each sentence from the TTS backend is decoded to PCM, has its leading and
+trailing silence trimmed, is normalized to a common loudness and gets short
+fade-in/fade-out ramps so back-to-back chunks join without clicks. All steps
+work on whole NumPy buffers; there are no per-sample Python loops.
+
+Loudness is measured as RMS in dBFS over the non-silent frames (a cheap
+stand-in for LUFS that is good enough to even out sentence-to-sentence
+volume from a single voice).
+
+Chunks are separate files played back to back, so there is no overlap
+crossfade: each chunk fades in from and out to silence, and the ramps sit
+inside the ``keep_silence_ms`` margin left by trimming.
+
+MP3 output is re-encoded at a constant bitrate (edge-tts's ~48 kbit/s by
+default, never above the source's) instead of libsndfile's LAME default,
+and the original bytes are kept when processing trimmed nothing and would
+only make the chunk bigger. soundfile 0.13+ takes the encoder settings
+directly; older versions are configured through libsndfile's
+``sf_command``, and if neither is available the default settings are used.
+"""
+
+import inspect
+import io
+import os
+from typing import List, Optional, Tuple
+
+# edge-tts default output is 48 kbit/s CBR MP3
+DEFAULT_BYTES_PER_SECOND = 6000
+
+# MPEG audio Layer III header tables, indexed by the header's version bits
+_MP3_BITRATES = {
+    "1": (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    "2": (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+# libsndfile sf_command ids (sndfile.h) for soundfile versions without encoder options
+_SFC_SET_COMPRESSION_LEVEL = 0x1301
+_SFC_SET_BITRATE_MODE = 0x1305
+_SF_BITRATE_MODE_CONSTANT = 0
+
+
+def audio_duration(audio: bytes) -> float:
+    """Playback length of an encoded chunk in seconds (bitrate estimate as fallback)."""
+    try:
+        import soundfile
+        return soundfile.info(io.BytesIO(audio)).duration
+    except Exception:
+        return len(audio) / DEFAULT_BYTES_PER_SECOND
+
+
+def mp3_frame_info(data: bytes, offset: int) -> Optional[Tuple[int, float]]:
+    """(frame length in bytes, duration in seconds) of the Layer III frame at ``offset``, or None."""
+    if offset + 4 > len(data) or data[offset] != 0xFF or data[offset + 1] & 0xE0 != 0xE0:
+        return None
+    version = (data[offset + 1] >> 3) & 0x03
+    layer = (data[offset + 1] >> 1) & 0x03
+    bitrate_index = data[offset + 2] >> 4
+    rate_index = (data[offset + 2] >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _MP3_BITRATES["1" if mpeg1 else "2"][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    padding = (data[offset + 2] >> 1) & 0x01
+    samples = 1152 if mpeg1 else 576
+    return samples // 8 * bitrate // sample_rate + padding, samples / sample_rate
+
+
+def mp3_bitrate(data: bytes, search_bytes: int = 4096) -> Optional[int]:
+    """Bitrate in kbit/s of the first Layer III frame within ``search_bytes``, or None."""
+    for offset in range(min(len(data), search_bytes)):
+        info = mp3_frame_info(data, offset)
+        if info is not None:
+            length, seconds = info
+            return round(length * 8 / seconds / 1000)  # padding byte rounds away
+    return None
+
+
+def mp3_compression_level(sample_rate: int, bitrate_kbps: int) -> float:
+    """libsndfile compression level that gives ``bitrate_kbps`` CBR at ``sample_rate``."""
+    # LAME interpolates between the version's highest and lowest bitrates
+    low, high = (32, 320) if sample_rate >= 32000 else (8, 160)
+    return min(1.0, max(0.0, (high - bitrate_kbps) / (high - low)))
+
+
+def mp3_main_data(frame: bytes) -> Tuple[int, int, bool]:
+    """(main_data_begin, main data bytes carried, is a Xing/Info tag) of a whole Layer III frame."""
+    mpeg1 = (frame[1] >> 3) & 0x03 == 3
+    mono = frame[3] >> 6 == 3
+    header = 4 if frame[1] & 0x01 else 6  # Protection bit clear: 16-bit CRC follows
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    if mpeg1:
+        begin = frame[header] << 1 | frame[header + 1] >> 7
+    else:
+        begin = frame[header]
+    start = header + side_info
+    return begin, len(frame) - start, frame[start:start + 4] in (b"Xing", b"Info")
+
+
+class MP3FrameAggregator:
+    """Regroups a streamed MP3 byte stream into pieces of whole frames.
+
+    Each piece is at least ``min_seconds`` long and starts on a frame
+    boundary. Layer III frames borrow main data from the frames before them
+    (the bit reservoir), and the decoder's overlap and synthesis filters
+    carry state across frames, so a piece decoded alone has a gap at its
+    start. Each piece therefore comes with a ``lead_in``: the two frames
+    before it plus the frames their reservoirs point into. Decoding
+    ``lead_in + piece`` and keeping the last ``seconds`` gives exactly the
+    piece's samples. ``lead_in`` is empty for the first piece of a stream.
+    """
+
+    # Frames decoded in full before a piece; one is not enough to prime the filters
+    WARM_UP_FRAMES = 2
+    # Longest reservoir a frame can point back into (9-bit main_data_begin)
+    MAX_RESERVOIR = 511
+    # Frames remembered before the oldest unneeded ones are dropped
+    MAX_HISTORY = 64
+
+    def __init__(self, min_seconds: float = 0.2):
+        self.min_seconds = min_seconds
+        self._buffer = bytearray()
+        self._ready = bytearray()  # Whole frames not yet emitted
+        self._ready_seconds = 0.0
+        self._lead_in = b""
+        self._history: List[Tuple[bytes, int, int]] = []  # (frame, main_data_begin, main data bytes)
+
+    def _reservoir(self) -> bytes:
+        """Frames the next piece needs in front of it, oldest first."""
+        start = len(self._history)
+        for index in range(max(0, start - self.WARM_UP_FRAMES), start):
+            # Step back until the frames before this one hold its reservoir
+            first, needed = index, self._history[index][1]
+            while needed > 0 and first > 0:
+                first -= 1
+                needed -= self._history[first][2]
+            start = min(start, first)
+        return b"".join(frame for frame, _, _ in self._history[start:])
+
+    def _trim_history(self):
+        # Keep the warm-up frames plus what maximal reservoirs of them could span
+        history = self._history
+        kept, start = 0, len(history) - self.WARM_UP_FRAMES
+        while start > 0 and kept < self.MAX_RESERVOIR:
+            start -= 1
+            kept += history[start][2]
+        del history[:start]
+
+    def feed(self, data: bytes) -> List[Tuple[bytes, float, bytes]]:
+        """Add stream bytes; returns the ``(piece, seconds, lead_in)`` triples now complete."""
+        self._buffer += data
+        buffer = self._buffer
+        offset = 0
+        pieces = []
+        while offset + 4 <= len(buffer):
+            if buffer[offset:offset + 3] == b"ID3":
+                if offset + 10 > len(buffer):
+                    break
+                size = 10 + ((buffer[offset + 6] & 0x7F) << 21 | (buffer[offset + 7] & 0x7F) << 14
+                             | (buffer[offset + 8] & 0x7F) << 7 | (buffer[offset + 9] & 0x7F))
+                if offset + size > len(buffer):
+                    break
+                offset += size
+                continue
+            info = mp3_frame_info(buffer, offset)
+            if info is None:
+                offset += 1  # Resynchronize on the next frame header
+                continue
+            length, seconds = info
+            if offset + length > len(buffer):
+                break
+            frame = bytes(buffer[offset:offset + length])
+            if not self._ready:
+                self._lead_in = self._reservoir()
+            self._ready += frame
+            begin, size, tag = mp3_main_data(frame)
+            if not tag:
+                # A Xing/Info header holds no audio and must not be sent twice
+                self._ready_seconds += seconds
+                self._history.append((frame, begin, size))
+                if len(self._history) >= self.MAX_HISTORY:
+                    self._trim_history()
+            offset += length
+            if self._ready_seconds >= self.min_seconds:
+                pieces.append((bytes(self._ready), self._ready_seconds, self._lead_in))
+                self._ready = bytearray()
+                self._ready_seconds = 0.0
+        del buffer[:offset]
+        return pieces
+
+    def flush(self) -> Tuple[bytes, float, bytes]:
+        """Whatever whole frames are left at the end of the stream."""
+        piece = (bytes(self._ready), self._ready_seconds, self._lead_in if self._ready else b"")
+        self._ready = bytearray()
+        self._ready_seconds = 0.0
+        self._buffer = bytearray()
+        self._history = []
+        return piece
+
+
+class AudioPostProcessor:
+    def __init__(
+        self,
+        silence_threshold_db: float = -45.0,
+        frame_ms: float = 10.0,
+        keep_silence_ms: float = 20.0,
+        target_dbfs: float = -18.0,
+        max_gain_db: float = 12.0,
+        fade_ms: float = 8.0,
+        output_format: str = "MP3",
+        mp3_bitrate_kbps: int = DEFAULT_BYTES_PER_SECOND * 8 // 1000,
+    ):
+        self.silence_threshold_db = silence_threshold_db
+        self.frame_ms = frame_ms
+        self.keep_silence_ms = keep_silence_ms
+        self.target_dbfs = target_dbfs
+        self.max_gain_db = max_gain_db
+        self.fade_ms = fade_ms
+        self.output_format = output_format
+        self.mp3_bitrate_kbps = mp3_bitrate_kbps
+
+        # Imported lazily so workers that never synthesize audio don't pay for them
+        import numpy
+        import soundfile
+        self._np = numpy
+        self._sf = soundfile
+        # soundfile 0.13 added encoder options; older versions need sf_command
+        self._encoder_options = "bitrate_mode" in inspect.signature(soundfile.SoundFile).parameters
+        self._sf_command = None
+        if not self._encoder_options:
+            ffi, snd = getattr(soundfile, "_ffi", None), getattr(soundfile, "_snd", None)
+            if ffi is not None and hasattr(snd, "sf_command"):
+                self._sf_command = ffi, snd
+
+    @classmethod
+    def from_env(cls) -> Optional["AudioPostProcessor"]:
+        """Build from AUDIO_* settings, or None if disabled or unavailable."""
+        if os.getenv("AUDIO_POSTPROCESS", "1").lower() not in ("1", "true", "yes"):
+            return None
+        try:
+            return cls(
+                silence_threshold_db=float(os.getenv("AUDIO_SILENCE_THRESHOLD_DB", "-45")),
+                keep_silence_ms=float(os.getenv("AUDIO_KEEP_SILENCE_MS", "20")),
+                target_dbfs=float(os.getenv("AUDIO_TARGET_DBFS", "-18")),
+                fade_ms=float(os.getenv("AUDIO_FADE_MS", "8")),
+                mp3_bitrate_kbps=int(os.getenv("AUDIO_MP3_BITRATE_KBPS", "48")),
+            )
+        except ImportError as e:
+            print(f"Audio post-processing disabled: {e}")
+            return None
+
+    def process(self, audio: bytes) -> bytes:
+        """Trim, normalize and fade one encoded chunk; returns the input unchanged on failure."""
+        if not audio:
+            return audio
+        try:
+            decoded, sample_rate = self.decode(audio)
+            samples = self.trim_silence(decoded, sample_rate)
+            if samples.size == 0:
+                return audio
+            samples = self.normalize(samples, sample_rate)
+            samples = self.apply_fades(samples, sample_rate)
+            bitrate = min(self.mp3_bitrate_kbps, mp3_bitrate(audio) or self.mp3_bitrate_kbps)
+            processed = self.encode(samples, sample_rate, bitrate)
+            if samples.size == decoded.size and len(processed) >= len(audio):
+                # Nothing trimmed: level and fades aren't worth extra bytes on the wire
+                return audio
+            return processed
+        except Exception as e:
+            print(f"Audio post-processing failed, sending original audio: {e}")
+            return audio
+
+    def decode(self, audio: bytes) -> Tuple["numpy.ndarray", int]:
+        samples, sample_rate = self._sf.read(io.BytesIO(audio), dtype="float32", always_2d=False)
+        if samples.ndim > 1:
+            samples = samples.mean(axis=1, dtype=self._np.float32)
+        return samples, sample_rate
+
+    def encode(self, samples, sample_rate: int, bitrate_kbps: int = None) -> bytes:
+        """Encode mono ``samples``; MP3 at a constant ``bitrate_kbps`` if given (and supported)."""
+        buffer = io.BytesIO()
+        constant = bitrate_kbps and self.output_format == "MP3"
+        options = {}
+        if constant and self._encoder_options:
+            options = {"bitrate_mode": "CONSTANT",
+                       "compression_level": mp3_compression_level(sample_rate, bitrate_kbps)}
+        with self._sf.SoundFile(buffer, "w", sample_rate, 1, format=self.output_format, **options) as f:
+            if constant and not options:
+                self._set_mp3_bitrate(f, sample_rate, bitrate_kbps)
+            f.write(samples)
+        return buffer.getvalue()
+
+    def _set_mp3_bitrate(self, sound_file, sample_rate: int, bitrate_kbps: int):
+        # soundfile 0.12 has no encoder options, so talk to libsndfile directly
+        # (must happen before the first write); keep the defaults if that fails
+        handle = getattr(sound_file, "_file", None)
+        if self._sf_command is None or handle is None:
+            return
+        ffi, snd = self._sf_command
+        try:
+            mode = ffi.new("int*", _SF_BITRATE_MODE_CONSTANT)
+            snd.sf_command(handle, _SFC_SET_BITRATE_MODE, mode, ffi.sizeof("int"))
+            level = ffi.new("double*", mp3_compression_level(sample_rate, bitrate_kbps))
+            snd.sf_command(handle, _SFC_SET_COMPRESSION_LEVEL, level, ffi.sizeof("double"))
+        except Exception as e:
+            print(f"Cannot set MP3 bitrate, using encoder defaults: {e}")
+            self._sf_command = None
+
+    def _frame_rms(self, samples, sample_rate: int):
+        """RMS per analysis frame (vectorized via reshape)."""
+        np = self._np
+        frame = max(1, int(sample_rate * self.frame_ms / 1000))
+        count = samples.size // frame
+        if count == 0:
+            return np.sqrt(np.mean(np.square(samples), keepdims=True)), frame
+        frames = samples[:count * frame].reshape(count, frame)
+        return np.sqrt(np.mean(np.square(frames), axis=1)), frame
+
+    def trim_silence(self, samples, sample_rate: int):
+        """Drop leading/trailing frames below the silence threshold."""
+        np = self._np
+        rms, frame = self._frame_rms(samples, sample_rate)
+        threshold = 10 ** (self.silence_threshold_db / 20)
+        loud = np.flatnonzero(rms > threshold)
+        if loud.size == 0:
+            return samples[:0]
+        keep = int(sample_rate * self.keep_silence_ms / 1000)
+        start = max(0, loud[0] * frame - keep)
+        end = min(samples.size, (loud[-1] + 1) * frame + keep)
+        return samples[start:end]
+
+    def normalize(self, samples, sample_rate: int):
+        """Scale to the target RMS level without clipping."""
+        np = self._np
+        rms, _ = self._frame_rms(samples, sample_rate)
+        threshold = 10 ** (self.silence_threshold_db / 20)
+        active = rms[rms > threshold]
+        if active.size == 0:
+            return samples
+        level = float(np.sqrt(np.mean(np.square(active))))
+        gain = 10 ** (self.target_dbfs / 20) / level
+        gain = min(gain, 10 ** (self.max_gain_db / 20))
+        peak = float(np.max(np.abs(samples)))
+        if peak * gain > 0.98:
+            gain = 0.98 / peak
+        return samples * np.float32(gain)
+
+    def apply_fades(self, samples, sample_rate: int):
+        """Raised-cosine fade in from and out to silence, so chunks played back to back join without clicks."""
+        np = self._np
+        length = min(int(sample_rate * self.fade_ms / 1000), samples.size // 2)
+        if length <= 0:
+            return samples
+        ramp = (0.5 - 0.5 * np.cos(np.linspace(0, np.pi, length, dtype=np.float32))).astype(np.float32)
+        samples = samples.copy()
+        samples[:length] *= ramp
+        samples[-length:] *= ramp[::-1]
+        return samples
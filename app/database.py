@@ -1,20 +1,65 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Boolean
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.sql import func
+import asyncio
 import os
+import queue
+import threading
+from concurrent.futures import Future
 from datetime import datetime
+from typing import Any, Callable
 import uuid
 
 # Database URL - support both PostgreSQL and SQLite
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./voicechat.db")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+IS_SQLITE_FILE = IS_SQLITE and DATABASE_URL not in ("sqlite://", "sqlite:///:memory:")
+
+# High-concurrency SQLite profile: WAL, one writer thread, read-only reader pool
+SQLITE_CONCURRENT = IS_SQLITE_FILE and os.getenv("SQLITE_CONCURRENT", "1").lower() in ("1", "true", "yes")
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000")),  # negative = KiB
+    "temp_store": "MEMORY",
+}
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "8"))
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", "100"))
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def _apply_sqlite_read_pragmas(dbapi_connection, connection_record):
+    _apply_sqlite_pragmas(dbapi_connection, connection_record)
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=1")
+    cursor.close()
 
 # Create engine
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+    connect_args={"check_same_thread": False} if IS_SQLITE else {}
 )
+if SQLITE_CONCURRENT:
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+    read_engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        pool_size=SQLITE_READ_POOL_SIZE,
+        max_overflow=0
+    )
+    event.listen(read_engine, "connect", _apply_sqlite_read_pragmas)
+else:
+    read_engine = engine
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 # Create base class
 Base = declarative_base()
@@ -25,7 +70,16 @@ class Conversation(Base):
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     title = Column(String(255), nullable=True)
     created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), index=True)
+    
+    # Summary for listings, maintained by the message writes (see summaries.py)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_snippet = Column(String(120), nullable=True)
+    last_role = Column(String(50), nullable=True)
+    audio_bytes = Column(BigInteger, nullable=False, default=0, server_default="0")
+    
+    # Generation profile the conversation is pinned to (None = automatic routing)
+    profile = Column(String(100), nullable=True)
     
     # Relationship
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
@@ -38,6 +92,9 @@ class Message(Base):
     content = Column(Text, nullable=False)
     role = Column(String(50), nullable=False)  # 'user' or 'assistant'
     audio_file_path = Column(String(500), nullable=True)
+    # Answered in text-first mode: its audio chunks (if any) are one per sentence of
+    # content, synthesized on request, instead of one per streamed phrase
+    text_first = Column(Boolean, nullable=False, default=False, server_default="0")
     created_at = Column(DateTime, default=func.now())
     
     # Relationship
@@ -56,13 +113,142 @@ class AudioChunk(Base):
     # Relationship
     message = relationship("Message")
 
+class WriteQueue:
+    """Serializes database writes through one connection on a dedicated thread.
+
+    Jobs are callables taking a Session. Jobs queued while a transaction is
+    running are committed together in the next one, so many concurrent
+    talkers cost one commit instead of one each. Jobs should return plain
+    values, not ORM objects bound to the writer's session.
+
+    When disabled (e.g. PostgreSQL) each job runs inline in its own session.
+    """
+
+    _STOP = object()
+
+    def __init__(self, session_factory, enabled: bool = True, max_batch: int = 100):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, job: Callable[[Any], Any]) -> Future:
+        """Queue a write and return a Future for its result."""
+        future = Future()
+        if not self.enabled:
+            self._execute([(job, future)])
+            return future
+        self._ensure_started()
+        self._queue.put((job, future))
+        return future
+
+    async def run(self, job: Callable[[Any], Any]) -> Any:
+        """Queue a write and wait for it to be committed."""
+        return await asyncio.wrap_future(self.submit(job))
+
+    def submit_background(self, job: Callable[[Any], Any]) -> Future:
+        """Queue a write without waiting; failures are logged."""
+        future = self.submit(job)
+        future.add_done_callback(_log_write_failure)
+        return future
+
+    def flush(self, timeout: float = None):
+        """Block until every write queued so far has been committed."""
+        self.submit(lambda session: None).result(timeout)
+
+    def stop(self, timeout: float = None):
+        """Commit outstanding writes and stop the writer thread."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(self._STOP)
+            thread.join(timeout)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._execute(batch)
+            if stop:
+                return
+
+    def _execute(self, batch):
+        """Run a batch in one transaction; on failure retry jobs one by one."""
+        session = self.session_factory()
+        try:
+            results = [job(session) for job, _ in batch]
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            session.close()
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            for item in batch:
+                self._execute([item])
+            return
+        session.close()
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+def _log_write_failure(future: Future):
+    if future.exception() is not None:
+        print(f"Database write failed: {future.exception()}")
+
+# Process-wide writer; its thread starts on first use so forked workers get their own
+db_writer = WriteQueue(SessionLocal, enabled=SQLITE_CONCURRENT, max_batch=DB_WRITE_BATCH_SIZE)
+
+# Columns added after the first release; create_all doesn't alter existing tables
+ADDED_COLUMNS = {
+    "conversations": {"profile": "VARCHAR(100)"},
+    "messages": {"text_first": "BOOLEAN NOT NULL DEFAULT FALSE"},
+}
+
+def add_missing_columns(table: str, columns: dict) -> list:
+    """ALTER TABLE ``table`` to add any of ``columns`` ({name: DDL type}) it lacks; returns the added names."""
+    existing = {column["name"] for column in inspect(engine).get_columns(table)}
+    missing = [name for name in columns if name not in existing]
+    if missing:
+        with engine.begin() as conn:
+            for name in missing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {columns[name]}"))
+    return missing
+
 # Create tables
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    for table, columns in ADDED_COLUMNS.items():
+        add_missing_columns(table, columns)
 
-# Database dependency
+# Database dependency (reads only - writes go through db_writer)
 def get_db():
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
         yield db
     finally:
@@ -0,0 +1,163 @@
+"""
+Dependency health: circuit breakers and a background prober.
+
+Probes run on a timer and their results are cached, so /health endpoints
+never make live calls. Each dependency has a CircuitBreaker fed by both the
+probes and real traffic; while a breaker is open, turns fail fast instead of
+piling onto a dependency that is restarting, and only the prober (or a
+single trial request after ``reset_timeout``) touches it until it recovers.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import text
+
+from .metrics import metrics
+
+
+class CircuitBreaker:
+    """closed -> open after ``failure_threshold`` consecutive failures,
+    half-open (one trial call) after ``reset_timeout`` seconds."""
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 15.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def available(self) -> bool:
+        """Whether a call would currently be let through (does not claim the trial)."""
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+        return self.state == "closed" or not self._trial_in_flight
+
+    def allow(self) -> bool:
+        """Whether a call may proceed now."""
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._trial_in_flight = False
+        if self.state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        metrics.increment(f"circuit.{self.name}.rejected")
+        return False
+
+    def record_success(self):
+        if self.state != "closed":
+            print(f"Circuit {self.name} closed")
+        self.state = "closed"
+        self.failures = 0
+        self._trial_in_flight = False
+        metrics.set_gauge(f"circuit.{self.name}", self.state)
+
+    def release(self):
+        """Give back a half-open trial that ended without a verdict (e.g. cancelled)."""
+        if self.state == "half_open":
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                print(f"Circuit {self.name} opened after {self.failures} failure(s)")
+                metrics.increment(f"circuit.{self.name}.opened")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        metrics.set_gauge(f"circuit.{self.name}", self.state)
+
+    def status(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.failures}
+
+
+class HealthMonitor:
+    """Periodically probes dependencies and caches the results."""
+
+    def __init__(self, interval: float = 5.0, probe_timeout: float = 2.0):
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+        self.probes: Dict[str, Dict[str, Any]] = {}
+        self.status: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def add_probe(self, name: str, probe: Callable[[], Awaitable[bool]],
+                  breaker: CircuitBreaker = None, every: int = 1, critical: bool = True):
+        """Register a probe; ``every`` runs it on every Nth cycle (for costlier checks)."""
+        self.probes[name] = {"probe": probe, "breaker": breaker, "every": every, "critical": critical}
+        self.status[name] = {"ok": None, "checked_at": None, "latency_ms": None, "error": None}
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="health-monitor")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        cycle = 0
+        while True:
+            await asyncio.gather(*(
+                self._check(name) for name, entry in self.probes.items()
+                if cycle % entry["every"] == 0
+            ))
+            cycle += 1
+            await asyncio.sleep(self.interval)
+
+    async def _check(self, name: str):
+        entry = self.probes[name]
+        started = time.perf_counter()
+        error = None
+        try:
+            ok = bool(await asyncio.wait_for(entry["probe"](), timeout=self.probe_timeout))
+        except asyncio.TimeoutError:
+            ok, error = False, "timeout"
+        except Exception as e:
+            ok, error = False, str(e)
+        latency = time.perf_counter() - started
+        metrics.observe(f"health.{name}", latency)
+
+        breaker = entry["breaker"]
+        if breaker is not None:
+            if ok:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+        self.status[name] = {
+            "ok": ok,
+            "checked_at": time.time(),
+            "latency_ms": round(latency * 1000, 1),
+            "error": error,
+        }
+
+    def ready(self) -> bool:
+        """All critical dependencies passed their last probe."""
+        return all(
+            self.status[name]["ok"] for name, entry in self.probes.items() if entry["critical"]
+        )
+
+    def report(self) -> Dict[str, Any]:
+        report = {}
+        for name, entry in self.probes.items():
+            report[name] = dict(self.status[name])
+            if entry["breaker"] is not None:
+                report[name]["circuit"] = entry["breaker"].status()
+        return report
+
+
+def database_probe(engine) -> Callable[[], Awaitable[bool]]:
+    """Probe running ``SELECT 1`` in a worker thread."""
+    def ping():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+
+    async def probe():
+        return await asyncio.get_running_loop().run_in_executor(None, ping)
+    return probe
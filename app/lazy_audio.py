@@ -0,0 +1,79 @@
+"""
+On-demand audio for text-first sessions.
+
+In text-first mode answers are streamed as text only and nothing is
+synthesized up front. When a client asks for a message's audio, sentence
+``i`` of the message's stored content becomes audio chunk ``i``. Each
+sentence is synthesized at most once: concurrent requests for the same
+sentence await one shared synthesis, finished audio is kept in a small LRU
+and persisted as an AudioChunk row, and later requests (or other workers)
+read the persisted row back instead of calling the TTS backend again.
+"""
+
+import asyncio
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from .metrics import metrics
+
+_Key = Tuple[str, int]  # (message_id, chunk_index)
+
+
+class LazyAudio:
+    def __init__(self, tts_service, persist: Callable[[str, int, str, bool], None], cache_size: int = 512):
+        self.tts = tts_service
+        self.persist = persist  # persist(message_id, chunk_index, audio_base64, is_final)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[_Key, str]" = OrderedDict()
+        self._inflight: Dict[_Key, asyncio.Task] = {}
+
+    def _remember(self, key: _Key, audio: str):
+        self._cache[key] = audio
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def prime(self, message_id: str, chunks: Dict[int, str]):
+        """Seed the cache with audio that is already persisted."""
+        for chunk_index, audio in chunks.items():
+            self._remember((message_id, chunk_index), audio)
+
+    def cached(self, message_id: str, chunk_index: int) -> Optional[str]:
+        audio = self._cache.get((message_id, chunk_index))
+        if audio is not None:
+            self._cache.move_to_end((message_id, chunk_index))
+        return audio
+
+    async def sentence_audio(self, message_id: str, chunk_index: int, sentence: str,
+                             voice: str = None, is_final: bool = False) -> str:
+        """Base64 audio for one sentence of a message ("" if synthesis failed)."""
+        key = (message_id, chunk_index)
+        audio = self.cached(message_id, chunk_index)
+        if audio is not None:
+            metrics.increment("lazy_audio.hits")
+            return audio
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._synthesize(key, sentence, voice, is_final))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._inflight.pop(key, None))
+        else:
+            metrics.increment("lazy_audio.deduplicated")
+        # A requester going away must not cancel a synthesis others are waiting for
+        return await asyncio.shield(task)
+
+    async def _synthesize(self, key: _Key, sentence: str, voice: str, is_final: bool) -> str:
+        message_id, chunk_index = key
+        with metrics.timer("lazy_audio.synthesis"):
+            if self.tts.scheduler is not None:
+                # Someone is waiting for this right now
+                audio = await self.tts.scheduler.submit(
+                    self.tts.text_to_speech_chunk, sentence, voice, buffered_seconds=0.0
+                )
+            else:
+                audio = await self.tts.text_to_speech_chunk(sentence, voice)
+        metrics.increment("lazy_audio.synthesized")
+        if audio:
+            self._remember(key, audio)
+            self.persist(message_id, chunk_index, audio, is_final)
+        return audio
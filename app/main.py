@@ -1,19 +1,42 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException
+import time
+
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
-import json
 import uuid
 import asyncio
+import random
+from functools import partial
 from typing import Dict, List
 import os
 
-from .database import get_db, create_tables, Conversation, Message, AudioChunk
+from .database import engine, read_engine, db_writer, get_db, create_tables, Conversation, Message, AudioChunk
 from .ollama_service import OllamaService
+from .health import HealthMonitor, database_probe
+from .routing import GenerationProfile, ModelRouter
+from .warmup import ModelWarmer
+from .memory import ConversationMemory, memory_from_env
+from .prompt_cache import prompt_cache_from_env
+from .streams import StreamRegistry, TurnStream
+from .lazy_audio import LazyAudio
 from .tts_service import TTSService
-from .models import ChatMessage, ChatResponse, ConversationCreate, ConversationResponse, MessageResponse, VoiceSettings
+from .tts_scheduler import TTSScheduler, PlaybackBuffer
+from .serialization import dumps, loads, FrameTemplate, JSON_BACKEND
+from .metrics import metrics
+from .profiling import (
+    LoopMonitor, PROFILING_ENABLED, MAX_PROFILE_SECONDS, correlation_id, log,
+    profile_cprofile, profile_sampling
+)
+from .search import create_search_index, index_messages, search_messages
+from .summaries import create_summary_columns, record_audio, record_latest, record_message, record_removed_message
+from .transfer import AUDIO_MODES, export_ndjson, import_ndjson
+from .maintenance import AudioMaintenance, run_periodically
+from .models import ChatMessage, ChatResponse, ConversationCreate, ConversationResponse, MessageResponse, ProfileOverride, VoiceSettings
 
 # Create FastAPI app
 app = FastAPI(title="Voice Chat with Ollama Mistral", version="1.0.0")
@@ -30,19 +53,56 @@ app.add_middleware(
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# How long a cancelled turn may take to release its resources
+CANCEL_TIMEOUT = float(os.getenv("CANCEL_TIMEOUT", "2.0"))
+
+# Drain settings for graceful shutdown / rolling restarts
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "20.0"))
+RECONNECT_DELAY_MS = int(os.getenv("RECONNECT_DELAY_MS", "2000"))
+
+# How long a turn keeps generating for a disconnected client that may resume it
+STREAM_RESUME_GRACE_SECONDS = float(os.getenv("STREAM_RESUME_GRACE_SECONDS", "30"))
+
+# With retrieval memory on, the most recent messages are always sent in full
+MEMORY_RECENT_MESSAGES = int(os.getenv("MEMORY_RECENT_MESSAGES", "12"))
+
+# Spoken instead of an error when the language model is unavailable
+FALLBACK_MESSAGE = os.getenv(
+    "FALLBACK_MESSAGE",
+    "Sorry, I can't think right now. My language model is unavailable. Please try again in a moment."
+)
+
 # WebSocket connection manager
 class ConnectionManager:
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
         self.active_tasks: Dict[str, asyncio.Task] = {}  # Track active streaming tasks
+        self.playback: Dict[str, PlaybackBuffer] = {}  # Estimated client audio buffer
+        self.text_first: Dict[str, bool] = {}  # Sessions that get audio only on request
+        self.drain_state = "serving"  # serving -> draining -> drained
+        self.drain_started_at = None
+        self.drain_result = None
+
+    @property
+    def draining(self) -> bool:
+        return self.drain_state != "serving"
 
     async def connect(self, websocket: WebSocket, client_id: str):
         await websocket.accept()
         self.active_connections[client_id] = websocket
 
-    def disconnect(self, client_id: str):
+    def disconnect(self, client_id: str, websocket: WebSocket = None):
+        if websocket is not None and self.active_connections.get(client_id) is not websocket:
+            # The client already reconnected; only let go of the old socket
+            turn_streams.detach_client(client_id, websocket)
+            return
         if client_id in self.active_connections:
             del self.active_connections[client_id]
+        self.playback.pop(client_id, None)
+        self.text_first.pop(client_id, None)
+        # Keep a resumable turn generating; the stream janitor cancels it after the grace period
+        if turn_streams.detach_client(client_id, websocket):
+            return
         # Cancel any active tasks for this client
         if client_id in self.active_tasks:
             self.active_tasks[client_id].cancel()
@@ -50,38 +110,220 @@ class ConnectionManager:
 
     async def send_personal_message(self, message: dict, client_id: str):
         if client_id in self.active_connections:
-            await self.active_connections[client_id].send_text(json.dumps(message))
+            await self.active_connections[client_id].send_text(dumps(message))
 
-    def set_active_task(self, client_id: str, task: asyncio.Task):
-        """Set an active streaming task for a client."""
-        # Cancel any existing task
-        if client_id in self.active_tasks:
-            self.active_tasks[client_id].cancel()
+    def playback_for(self, client_id: str) -> PlaybackBuffer:
+        if client_id not in self.playback:
+            self.playback[client_id] = PlaybackBuffer()
+        return self.playback[client_id]
+
+    async def start_turn(self, client_id: str, coro, name: str = None) -> asyncio.Task:
+        """Run a chat turn as the client's active task.
+
+        Any turn already in progress is preempted first (barge-in), and we
+        wait for it to wind down so its partial answer is saved before the
+        new user message is written.
+        """
+        await self.cancel_turn(client_id, reason="barge_in")
+        # The client stops playback when it sends a new utterance
+        self.playback_for(client_id).reset()
+        task = asyncio.create_task(coro, name=name)
         self.active_tasks[client_id] = task
+        task.add_done_callback(lambda t: self._clear_task(client_id, t))
+        return task
 
-    def stop_streaming(self, client_id: str):
-        """Stop streaming for a specific client."""
-        if client_id in self.active_tasks:
-            self.active_tasks[client_id].cancel()
+    async def cancel_turn(self, client_id: str, reason: str = "stop") -> bool:
+        """Cancel the client's active turn and wait until it is idle."""
+        task = self.active_tasks.pop(client_id, None)
+        if task is None or task.done():
+            return False
+        if client_id in self.playback:
+            self.playback[client_id].reset()
+        started = time.perf_counter()
+        task.cancel()
+        await asyncio.wait({task}, timeout=CANCEL_TIMEOUT)
+        metrics.observe("cancel.to_idle", time.perf_counter() - started)
+        metrics.increment(f"cancel.{reason}")
+        return True
+
+    def _clear_task(self, client_id: str, task: asyncio.Task):
+        if self.active_tasks.get(client_id) is task:
             del self.active_tasks[client_id]
-            return True
-        return False
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT) -> dict:
+        """Stop taking new work, let active turns finish, then ask clients to reconnect.
+
+        Turns still running after ``timeout`` seconds are cancelled, which
+        persists the part of the answer that was already spoken.
+        """
+        if self.drain_state != "serving":
+            return self.drain_result or self.drain_status()
+        self.drain_state = "draining"
+        self.drain_started_at = time.time()
+        started = time.perf_counter()
+        print(f"Draining: waiting for {len(self.active_tasks)} active turn(s)")
+
+        pending = [task for task in self.active_tasks.values() if not task.done()]
+        finished = 0
+        if pending:
+            done, pending = await asyncio.wait(pending, timeout=timeout)
+            finished = len(done)
+        for client_id in list(self.active_tasks):
+            await self.cancel_turn(client_id, reason="drain")
+
+        # Spread reconnects out so clients don't all hit the next instance at once
+        for client_id, websocket in list(self.active_connections.items()):
+            try:
+                await websocket.send_text(dumps({
+                    "type": "reconnect",
+                    "reason": "server_draining",
+                    "retry_after_ms": random.randint(RECONNECT_DELAY_MS, RECONNECT_DELAY_MS * 2)
+                }))
+                await websocket.close(code=1012)  # Service restart
+            except Exception:
+                pass
+            self.disconnect(client_id)
+
+        self.drain_state = "drained"
+        self.drain_result = {
+            **self.drain_status(),
+            "turns_completed": finished,
+            "turns_cancelled": len(pending),
+            "duration_seconds": round(time.perf_counter() - started, 3)
+        }
+        metrics.observe("drain.duration", time.perf_counter() - started)
+        print(f"Drain finished: {self.drain_result}")
+        return self.drain_result
+
+    def drain_status(self) -> dict:
+        return {
+            "state": self.drain_state,
+            "started_at": self.drain_started_at,
+            "active_connections": len(self.active_connections),
+            "active_turns": len(self.active_tasks),
+            "pending_writes": db_writer.pending()
+        }
 
 manager = ConnectionManager()
+turn_streams = StreamRegistry(
+    grace_seconds=STREAM_RESUME_GRACE_SECONDS, retain_seconds=max(STREAM_RESUME_GRACE_SECONDS, 60.0)
+)
 
-# Initialize services
-ollama_service = OllamaService()
-tts_service = TTSService()
+# Services are created per worker process in startup_event (not at import
+# time) so a preloading master never forks an open HTTP client.
+ollama_service: OllamaService = None
+model_router: ModelRouter = None
+tts_service: TTSService = None
+tts_scheduler: TTSScheduler = None
+lazy_audio: LazyAudio = None
+audio_maintenance: AudioMaintenance = None
+maintenance_task: asyncio.Task = None
+loop_monitor: LoopMonitor = None
+health_monitor: HealthMonitor = None
+model_warmer: ModelWarmer = None
+conversation_memory: ConversationMemory = None
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database tables on startup."""
+    """Initialize database tables and services on startup."""
+    global ollama_service, model_router, tts_service, tts_scheduler, lazy_audio, audio_maintenance, maintenance_task, loop_monitor, health_monitor, model_warmer, conversation_memory
+    started = time.perf_counter()
+    
     create_tables()
+    create_summary_columns()
+    create_search_index()
+    model_router = ModelRouter.from_env()
+    ollama_service = OllamaService(
+        base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+        model=model_router.profiles[model_router.default].model,
+        connect_timeout=float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5")),
+        first_token_timeout=float(os.getenv("OLLAMA_FIRST_TOKEN_TIMEOUT", "60")),
+        inter_token_timeout=float(os.getenv("OLLAMA_INTER_TOKEN_TIMEOUT", "15")),
+        retries=int(os.getenv("OLLAMA_RETRIES", "1")),
+        prompt_cache=prompt_cache_from_env()
+    )
+    conversation_memory = memory_from_env(ollama_service.base_url)
+    tts_scheduler = TTSScheduler(
+        concurrency=int(os.getenv("TTS_CONCURRENCY", "4")),
+        urgent_threshold=float(os.getenv("TTS_URGENT_BUFFER_SECONDS", "1.0"))
+    )
+    tts_service = TTSService(
+        scheduler=tts_scheduler,
+        streaming=os.getenv("TTS_STREAMING", "0").lower() in ("1", "true", "yes"),
+        stream_min_seconds=float(os.getenv("TTS_STREAM_MIN_MS", "200")) / 1000
+    )
+    lazy_audio = LazyAudio(
+        tts_service, persist=_persist_lazy_audio,
+        cache_size=int(os.getenv("LAZY_AUDIO_CACHE_SIZE", "512"))
+    )
+    health_monitor = HealthMonitor(
+        interval=float(os.getenv("HEALTH_INTERVAL_SECONDS", "5")),
+        probe_timeout=float(os.getenv("HEALTH_PROBE_TIMEOUT", "2"))
+    )
+    health_monitor.add_probe("ollama", ollama_service.health_check, breaker=ollama_service.breaker)
+    health_monitor.add_probe("database", database_probe(read_engine))
+    # Text replies still work without TTS, and listing voices is comparatively costly
+    health_monitor.add_probe("tts", tts_service.health_check, breaker=tts_service.breaker,
+                             every=12, critical=False)
+    health_monitor.start()
+    if turn_streams.enabled:
+        turn_streams.start()
+    if os.getenv("WARMUP_ENABLED", "1").lower() in ("1", "true", "yes"):
+        voices = os.getenv("WARMUP_VOICES", "").strip() or os.getenv("DEFAULT_VOICE", tts_service.voice)
+        model_warmer = ModelWarmer(
+            ollama_service, model_router, tts_service,
+            voices=[voice.strip() for voice in voices.split(",") if voice.strip()],
+            refresh_interval=float(os.getenv("WARMUP_REFRESH_SECONDS", "240")),
+            traffic_window=float(os.getenv("WARMUP_TRAFFIC_WINDOW_SECONDS", "1800")),
+            keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "").strip() or "10m",
+            pin_default=os.getenv("WARMUP_PIN_DEFAULT", "1").lower() in ("1", "true", "yes")
+        )
+        # In the background: the worker accepts connections while models load
+        model_warmer.start()
+    audio_maintenance = AudioMaintenance()
+    if os.getenv("MAINTENANCE_ENABLED", "0").lower() in ("1", "true", "yes"):
+        interval = float(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "3600"))
+        maintenance_task = asyncio.create_task(run_periodically(audio_maintenance, interval))
+    if os.getenv("LOOP_MONITOR_ENABLED", "1").lower() in ("1", "true", "yes"):
+        loop_monitor = LoopMonitor(
+            interval=float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1")),
+            slow_threshold=float(os.getenv("LOOP_SLOW_THRESHOLD", "0.25"))
+        )
+        loop_monitor.start()
+    
+    metrics.observe("startup.import", started - _import_started)
+    metrics.observe("startup.init", time.perf_counter() - started)
+    metrics.set_gauge("process.pid", os.getpid())
+    metrics.set_gauge("json.backend", JSON_BACKEND)
+    print(f"Worker {os.getpid()} ready: import {started - _import_started:.3f}s, "
+          f"init {time.perf_counter() - started:.3f}s")
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Clean up resources on shutdown."""
-    await ollama_service.close()
+    """Clean up resources on shutdown.
+
+    By now uvicorn has already closed every connection; serve.py drains on
+    the exit signal before that happens. This only covers other launchers.
+    """
+    await manager.drain()
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+    if loop_monitor is not None:
+        loop_monitor.stop()
+    if health_monitor is not None:
+        health_monitor.stop()
+    if model_warmer is not None:
+        model_warmer.stop()
+    turn_streams.stop()
+    if tts_scheduler is not None:
+        tts_scheduler.stop()
+    # Commit queued writes, then return pooled DB connections
+    db_writer.stop(timeout=DRAIN_TIMEOUT)
+    engine.dispose()
+    if ollama_service is not None:
+        await ollama_service.close()
+    if conversation_memory is not None:
+        await conversation_memory.close()
 
 @app.get("/")
 async def root():
@@ -89,13 +331,102 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    ollama_connected = await ollama_service.health_check()
-    return {
-        "status": "healthy",
-        "ollama_connected": ollama_connected,
-        "database_connected": True
+    """Health check endpoint (503 while draining so load balancers stop routing here).
+    
+    Served from the background prober's cache; never calls dependencies inline.
+    """
+    checks = health_monitor.report()
+    if manager.draining:
+        status = "draining"
+    elif not health_monitor.ready():
+        status = "degraded"
+    else:
+        status = "healthy"
+    body = {
+        "status": status,
+        "ollama_connected": bool(checks["ollama"]["ok"]),
+        "database_connected": bool(checks["database"]["ok"]),
+        "checks": checks,
+        "warmup": model_warmer.report() if model_warmer is not None else None,
+        "drain": manager.drain_status()
     }
+    if manager.draining:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness: the worker's event loop is responsive."""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: critical dependencies are up, warm-up has run and the worker is not draining."""
+    warmed = model_warmer is None or model_warmer.done
+    ready = health_monitor.ready() and warmed and not manager.draining
+    body = {
+        "ready": ready,
+        "draining": manager.draining,
+        "warmup": model_warmer.state if model_warmer is not None else "disabled",
+        "checks": health_monitor.report()
+    }
+    if not ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@app.post("/admin/drain")
+async def start_drain():
+    """Begin draining this worker ahead of a restart (e.g. from a preStop hook)."""
+    if not manager.draining:
+        asyncio.create_task(manager.drain())
+    return manager.drain_status()
+
+@app.get("/admin/maintenance")
+async def get_maintenance_report():
+    """Report from the last audio retention pass."""
+    return {"policy": vars(audio_maintenance.policy), "last_report": audio_maintenance.last_report}
+
+@app.post("/admin/maintenance")
+async def run_maintenance(vacuum: bool = None):
+    """Run an audio retention pass now and report what was reclaimed."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, audio_maintenance.run, vacuum)
+
+@app.get("/admin/tts")
+async def get_tts_report():
+    """TTS scheduler queue depth, waits and deadline misses per priority."""
+    return tts_scheduler.report()
+
+@app.get("/admin/models")
+async def get_model_routing():
+    """Generation profiles, routing counts and override totals."""
+    return model_router.report()
+
+@app.get("/admin/loop")
+async def get_loop_report():
+    """Event-loop lag summary and recently captured slow-callback stacks."""
+    if loop_monitor is None:
+        raise HTTPException(status_code=404, detail="Loop monitor is disabled")
+    return loop_monitor.report()
+
+@app.post("/admin/profile")
+async def run_profile(seconds: float = 10.0, mode: str = "sampling", limit: int = 50):
+    """Profile this worker for a few seconds (PROFILING_ENABLED=1 required)."""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="Profiling is disabled")
+    if mode not in ("sampling", "cprofile"):
+        raise HTTPException(status_code=400, detail="mode must be sampling or cprofile")
+    seconds = max(0.1, min(seconds, MAX_PROFILE_SECONDS))
+    if mode == "cprofile":
+        result = await profile_cprofile(seconds, limit=limit)
+    else:
+        result = await profile_sampling(seconds, limit=limit)
+    return PlainTextResponse(result)
+
+@app.get("/metrics")
+async def get_metrics():
+    """In-process metrics for this worker."""
+    return metrics.snapshot()
 
 @app.get("/voices")
 async def get_available_voices():
@@ -103,218 +434,705 @@ async def get_available_voices():
     return {"voices": tts_service.get_available_voices()}
 
 @app.post("/conversations", response_model=ConversationResponse)
-async def create_conversation(conversation: ConversationCreate, db: Session = Depends(get_db)):
+async def create_conversation(conversation: ConversationCreate):
     """Create a new conversation."""
-    db_conversation = Conversation(
-        id=str(uuid.uuid4()),
-        title=conversation.title or "New Conversation"
-    )
-    db.add(db_conversation)
-    db.commit()
-    db.refresh(db_conversation)
-    return db_conversation
+    return await db_writer.run(partial(
+        _insert_conversation,
+        str(uuid.uuid4()),
+        conversation.title or "New Conversation"
+    ))
 
 @app.get("/conversations", response_model=List[ConversationResponse])
 async def get_conversations(db: Session = Depends(get_db)):
-    """Get all conversations."""
+    """Get all conversations with their summaries (one indexed query, no aggregates)."""
     conversations = db.query(Conversation).order_by(Conversation.updated_at.desc()).all()
     return conversations
 
+@app.get("/conversations/export")
+async def export_conversations(audio: str = "none"):
+    """Stream all conversations and messages as NDJSON (audio: none, refs or inline)."""
+    if audio not in AUDIO_MODES:
+        raise HTTPException(status_code=400, detail=f"audio must be one of {', '.join(AUDIO_MODES)}")
+    # Sync generator - Starlette iterates it in a worker thread
+    return StreamingResponse(
+        export_ndjson(audio),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=conversations.ndjson"}
+    )
+
+@app.post("/conversations/import")
+async def import_conversations(request: Request):
+    """Import an NDJSON export streamed in the request body."""
+    return await import_ndjson(request.stream())
+
 @app.get("/conversations/{conversation_id}/messages", response_model=List[MessageResponse])
 async def get_conversation_messages(conversation_id: str, db: Session = Depends(get_db)):
     """Get messages for a specific conversation."""
     messages = db.query(Message).filter(Message.conversation_id == conversation_id).order_by(Message.created_at).all()
     return messages
 
+@app.put("/conversations/{conversation_id}/profile")
+async def set_conversation_profile(conversation_id: str, override: ProfileOverride):
+    """Pin a conversation to a generation profile, or clear the override."""
+    if override.profile is not None and override.profile not in model_router.profiles:
+        raise HTTPException(status_code=404, detail=f"Unknown profile {override.profile!r}")
+    if not await db_writer.run(partial(_set_conversation_profile, conversation_id, override.profile)):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return {"conversation_id": conversation_id, "profile": override.profile}
+
+@app.get("/search")
+async def search(q: str, conversation_id: str = None, limit: int = 20, offset: int = 0):
+    """Full-text search over messages, best matches first."""
+    # The FTS query is synchronous; keep it off the event loop
+    return await asyncio.get_running_loop().run_in_executor(
+        None, partial(search_messages, q, conversation_id=conversation_id, limit=limit, offset=offset)
+    )
+
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     """WebSocket endpoint for real-time voice chat."""
+    if manager.draining:
+        # Refuse new connections; the client will retry another instance
+        await websocket.close(code=1013)  # Try again later
+        return
     await manager.connect(websocket, client_id)
     
     try:
         while True:
             # Receive message from client
             data = await websocket.receive_text()
-            message_data = json.loads(data)
+            message_data = loads(data)
             
             # Handle different message types
-            if message_data.get("type") == "chat":
-                await handle_chat_message(websocket, message_data, client_id)
+            if message_data.get("type") == "chat" and manager.draining:
+                await websocket.send_text(dumps({
+                    "type": "reconnect",
+                    "reason": "server_draining",
+                    "retry_after_ms": RECONNECT_DELAY_MS
+                }))
+            elif message_data.get("type") == "chat":
+                # Run the turn in the background so stop/barge-in messages
+                # are still received while the answer is streaming
+                turn_id = uuid.uuid4().hex[:12]
+                turn_stream = turn_streams.open(turn_id, client_id, websocket, manager.playback_for(client_id))
+                turn_stream.task = await manager.start_turn(
+                    client_id,
+                    handle_chat_message(turn_stream, message_data, client_id, turn_id),
+                    name=f"turn-{turn_id}"
+                )
+                turn_stream.task.add_done_callback(lambda t, s=turn_stream: s.finish())
+            elif message_data.get("type") == "resume":
+                await handle_resume(websocket, message_data, client_id)
+            elif message_data.get("type") == "session_settings":
+                await handle_session_settings(websocket, message_data, client_id)
+            elif message_data.get("type") == "audio_request":
+                # Synthesis can take a while; keep receiving meanwhile
+                task = asyncio.create_task(handle_audio_request(websocket, message_data, client_id))
+                _audio_requests.add(task)
+                task.add_done_callback(_audio_requests.discard)
             elif message_data.get("type") == "voice_settings":
                 await handle_voice_settings(websocket, message_data, client_id)
             elif message_data.get("type") == "stop_streaming":
                 await handle_stop_streaming(websocket, message_data, client_id)
+            elif message_data.get("type") == "buffer_status":
+                # Client reports how much audio it still has queued
+                manager.playback_for(client_id).report(message_data.get("buffered_ms", 0) / 1000)
                 
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
+        manager.disconnect(client_id, websocket)
     except Exception as e:
         print(f"WebSocket error: {e}")
-        manager.disconnect(client_id)
+        manager.disconnect(client_id, websocket)
 
-async def handle_chat_message(websocket: WebSocket, message_data: dict, client_id: str):
+async def handle_chat_message(turn_stream: TurnStream, message_data: dict, client_id: str, turn_id: str = None):
     """Handle incoming chat messages and stream responses."""
+    # Tag log and profile output for this turn
+    correlation_id.set(turn_id)
+    db = None
     try:
         content = message_data.get("content", "")
         conversation_id = message_data.get("conversation_id")
-        voice = message_data.get("voice", "en-US-JennyNeural")
+        # Voice is per turn; the shared service default is left alone
+        voice = message_data.get("voice") or tts_service.voice
         
-        # Update TTS voice if specified
-        if voice != tts_service.voice:
-            tts_service.voice = voice
-        
-        # Get database session
-        db = next(get_db())
+        # Fail fast while Ollama's circuit is open rather than queueing behind timeouts
+        if not ollama_service.breaker.available():
+            await send_fallback(turn_stream, conversation_id, voice)
+            return
         
-        # Create conversation if not exists
+        # Create conversation if not exists, and save user message
+        title = None
         if not conversation_id:
-            conversation = Conversation(
-                id=str(uuid.uuid4()),
-                title=content[:50] + "..." if len(content) > 50 else content
-            )
-            db.add(conversation)
-            db.commit()
-            db.refresh(conversation)
-            conversation_id = conversation.id
-        
-        # Save user message
-        user_message = Message(
-            id=str(uuid.uuid4()),
-            conversation_id=conversation_id,
-            content=content,
-            role="user"
-        )
-        db.add(user_message)
-        db.commit()
+            conversation_id = str(uuid.uuid4())
+            title = content[:50] + "..." if len(content) > 50 else content
+        user_message_id = await db_writer.run(partial(_insert_user_message, conversation_id, title, content))
         
-        # Get conversation history
-        messages = db.query(Message).filter(Message.conversation_id == conversation_id).order_by(Message.created_at).all()
+        # Get database session (reads only)
+        db = next(get_db())
         
-        # Prepare messages for Ollama
-        ollama_messages = []
-        for msg in messages:
-            ollama_messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
+        pinned = db.query(Conversation.profile).filter(Conversation.id == conversation_id).scalar()
+        profile = model_router.route(content, pinned, requested=message_data.get("profile"))
+        log(f"Routing to profile {profile.name} ({profile.model})")
         
-        # Create assistant message
-        assistant_message = Message(
-            id=str(uuid.uuid4()),
-            conversation_id=conversation_id,
-            content="",
-            role="assistant"
-        )
-        db.add(assistant_message)
-        db.commit()
+        # Get conversation history and prepare messages for Ollama
+        if conversation_memory is None:
+            # The new user message goes last explicitly so the prompt only grows at the end
+            messages = db.query(Message).filter(
+                Message.conversation_id == conversation_id, Message.id != user_message_id
+            ).order_by(Message.created_at).all()
+            ollama_messages = [{"role": msg.role, "content": msg.content} for msg in messages]
+            ollama_messages.append({"role": "user", "content": content})
+        db.close()
+        if conversation_memory is not None:
+            ollama_messages = await _build_context_with_memory(conversation_id, content, user_message_id)
         
-        # Create streaming task
-        streaming_task = asyncio.create_task(
-            stream_response(websocket, ollama_messages, assistant_message, conversation_id, db)
-        )
-        
-        # Track the task
-        manager.set_active_task(client_id, streaming_task)
+        # Create assistant message (queued ahead of its audio chunks)
+        assistant_message_id = str(uuid.uuid4())
+        text_first = manager.text_first.get(client_id, False)
+        db_writer.submit_background(partial(
+            _insert_assistant_message, assistant_message_id, conversation_id, text_first
+        ))
         
-        # Wait for the task to complete
         try:
-            await streaming_task
+            await stream_response(
+                turn_stream, ollama_messages, assistant_message_id, conversation_id,
+                voice=voice, playback=manager.playback_for(client_id), profile=profile,
+                text_first=text_first
+            )
         except asyncio.CancelledError:
-            print(f"Streaming cancelled for client {client_id}")
-            # Update assistant message to indicate it was cancelled
-            assistant_message.content = "[Response cancelled by user]"
-            db.commit()
+            log(f"Streaming cancelled for client {client_id}")
+            raise
         except Exception as e:
-            print(f"Error in streaming task: {e}")
-            await websocket.send_text(json.dumps({
+            log(f"Error in streaming task: {e}")
+            await turn_stream.send_text(dumps({
                 "type": "error",
                 "content": f"Error processing message: {str(e)}"
             }))
             
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
-        print(f"Error handling chat message: {e}")
-        await websocket.send_text(json.dumps({
+        log(f"Error handling chat message: {e}")
+        await turn_stream.send_text(dumps({
             "type": "error",
             "content": f"Error processing message: {str(e)}"
         }))
+    finally:
+        if db is not None:
+            db.close()
+
+async def _build_context_with_memory(conversation_id: str, content: str, user_message_id: str) -> list:
+    """Recent messages in full plus the older messages most similar to ``content``.
+    
+    Reads run in the executor with their own session, so no pooled
+    connection is held while the recall is awaited.
+    """
+    loop = asyncio.get_running_loop()
+    recent, older_count = await loop.run_in_executor(
+        None, _load_recent_messages, conversation_id, user_message_id
+    )
+    
+    if older_count > 0 and conversation_memory.count(conversation_id) == 0:
+        # Started before memory was enabled: send everything once and index it
+        messages = await loop.run_in_executor(None, _load_messages, conversation_id)
+        conversation_memory.backfill_background(conversation_id, [(message_id, text) for message_id, _, text in messages])
+        return [{"role": role, "content": text} for _, role, text in messages]
+    
+    conversation_memory.remember_background(conversation_id, [(user_message_id, content)])
+    ollama_messages = []
+    if older_count > 0:
+        recalled_ids = await conversation_memory.recall(
+            conversation_id, content, exclude=[message_id for message_id, _, _ in recent] + [user_message_id]
+        )
+        if recalled_ids:
+            recalled = await loop.run_in_executor(None, _load_messages, conversation_id, recalled_ids)
+            metrics.increment("memory.recalled", len(recalled))
+            ollama_messages.append({
+                "role": "system",
+                "content": "Relevant earlier messages from this conversation:\n" + "\n".join(
+                    f"{role}: {text}" for _, role, text in recalled
+                )
+            })
+    ollama_messages.extend({"role": role, "content": text} for _, role, text in recent)
+    ollama_messages.append({"role": "user", "content": content})
+    return ollama_messages
 
-async def stream_response(websocket: WebSocket, ollama_messages: list, assistant_message: Message, conversation_id: str, db):
-    """Stream response from Ollama with audio conversion."""
+def _load_recent_messages(conversation_id: str, user_message_id: str):
+    """The last ``(id, role, content)`` rows before the new user message, oldest first, and how many are older."""
+    db = next(get_db())
+    try:
+        conversation = Message.conversation_id == conversation_id
+        # The new user message is appended explicitly; created_at alone may tie with the previous answer
+        recent = db.query(Message.id, Message.role, Message.content).filter(
+            conversation, Message.id != user_message_id
+        ).order_by(Message.created_at.desc()).limit(max(0, MEMORY_RECENT_MESSAGES - 1)).all()
+        recent = [tuple(row) for row in reversed(recent)]
+        older_count = db.query(func.count(Message.id)).filter(conversation).scalar() - len(recent) - 1
+        return recent, older_count
+    finally:
+        db.close()
+
+def _load_messages(conversation_id: str, message_ids: list = None):
+    """``(id, role, content)`` of a conversation's messages (or just ``message_ids``), oldest first."""
+    db = next(get_db())
+    try:
+        query = db.query(Message.id, Message.role, Message.content).filter(Message.conversation_id == conversation_id)
+        if message_ids is not None:
+            query = query.filter(Message.id.in_(message_ids))
+        return [tuple(row) for row in query.order_by(Message.created_at).all()]
+    finally:
+        db.close()
+
+async def stream_response(turn_stream: TurnStream, ollama_messages: list, assistant_message_id: str, conversation_id: str,
+                          voice: str = None, playback: PlaybackBuffer = None, profile: GenerationProfile = None,
+                          text_first: bool = False):
+    """Stream response from Ollama with audio conversion.
+    
+    With ``text_first`` only text is sent; audio is synthesized later if the
+    client asks for it (see handle_audio_request).
+    """
+    spoken_response = ""  # Text whose audio has actually been sent
     try:
         # Stream response from Ollama
         full_response = ""
         chunk_counter = 0
-        async for chunk in ollama_service.stream_chat(ollama_messages, conversation_id):
-            if chunk["type"] == "chunk":
-                chunk_content = chunk["content"]
-                full_response += chunk_content
-                
-                # Convert chunk to speech
-                async for audio_chunk in tts_service.stream_text_to_speech(chunk_content):
-                    # Save audio chunk to database
-                    db_audio_chunk = AudioChunk(
-                        id=str(uuid.uuid4()),
-                        message_id=assistant_message.id,
-                        chunk_index=chunk_counter,
-                        audio_data=audio_chunk["audio_data"],
-                        is_final=audio_chunk["is_final"]
-                    )
-                    db.add(db_audio_chunk)
-                    db.commit()
-                    
-                    # Send to client with accumulated content
-                    response_data = {
-                        "type": "chat_response",
-                        "message_id": assistant_message.id,
-                        "content": full_response,  # Send accumulated content
-                        "conversation_id": conversation_id,
-                        "audio_data": audio_chunk["audio_data"],
-                        "chunk_index": chunk_counter,
-                        "is_final": audio_chunk["is_final"]
-                    }
+        frame = FrameTemplate(
+            type="chat_response",
+            message_id=assistant_message_id,
+            conversation_id=conversation_id,
+            turn_id=correlation_id.get()
+        )
+        chat_stream = _chat_with_escalation(ollama_messages, conversation_id, profile)
+        try:
+            async for chunk in chat_stream:
+                if chunk["type"] == "chunk":
+                    chunk_content = chunk["content"]
+                    full_response += chunk_content
                     
-                    await websocket.send_text(json.dumps(response_data))
-                    chunk_counter += 1
+                    if text_first:
+                        await turn_stream.send_text(frame.render(
+                            content=full_response,
+                            audio_data=None,
+                            chunk_index=chunk_counter,
+                            is_final=chunk["is_final"]
+                        ), chunk_index=chunk_counter)
+                        # Nothing is spoken; what was shown is what the user got
+                        spoken_response = full_response.strip()
+                        chunk_counter += 1
+                        continue
                     
-                    # Small delay to prevent overwhelming the client
-                    await asyncio.sleep(0.05)
-            
-            elif chunk["type"] == "error":
-                await websocket.send_text(json.dumps({
-                    "type": "error",
-                    "content": chunk["content"]
-                }))
-                break
-        
-        # Update assistant message with full content
-        assistant_message.content = full_response
-        db.commit()
+                    # Convert chunk to speech
+                    speech_stream = tts_service.stream_text_to_speech(
+                        chunk_content, voice=voice, playback=playback, first_of_turn=chunk_counter == 0
+                    )
+                    try:
+                        async for audio_chunk in speech_stream:
+                            if audio_chunk.get("partial"):
+                                # Streaming TTS: forward the piece now, persist at sentence end
+                                await turn_stream.send_text(frame.render(
+                                    content=full_response,
+                                    audio_data=audio_chunk["audio_data"],
+                                    chunk_index=chunk_counter,
+                                    part_index=audio_chunk["part_index"],
+                                    lead_in=audio_chunk["lead_in"],
+                                    duration=audio_chunk["duration"],
+                                    is_final=False
+                                ), chunk_index=chunk_counter)
+                                if playback is not None:
+                                    playback.add(audio_chunk["duration"])
+                                continue
+                            if audio_chunk.get("sentence_end"):
+                                db_writer.submit_background(partial(_add_audio_chunk, conversation_id, AudioChunk(
+                                    id=str(uuid.uuid4()),
+                                    message_id=assistant_message_id,
+                                    chunk_index=chunk_counter,
+                                    audio_data=audio_chunk["sentence_audio"],
+                                    is_final=audio_chunk["is_final"]
+                                )))
+                                if audio_chunk["is_final"]:
+                                    await turn_stream.send_text(frame.render(
+                                        content=full_response,
+                                        audio_data=None,
+                                        chunk_index=chunk_counter,
+                                        is_final=True
+                                    ), chunk_index=chunk_counter)
+                                spoken_response = _join_spoken(spoken_response, audio_chunk["text"])
+                                chunk_counter += 1
+                                continue
+                            
+                            # Save audio chunk to database (batched by the writer);
+                            # without audio (TTS unavailable) only the text is sent
+                            if audio_chunk["audio_data"]:
+                                db_writer.submit_background(partial(_add_audio_chunk, conversation_id, AudioChunk(
+                                    id=str(uuid.uuid4()),
+                                    message_id=assistant_message_id,
+                                    chunk_index=chunk_counter,
+                                    audio_data=audio_chunk["audio_data"],
+                                    is_final=audio_chunk["is_final"]
+                                )))
+                            
+                            # Send to client with accumulated content
+                            await turn_stream.send_text(frame.render(
+                                content=full_response,  # Send accumulated content
+                                audio_data=audio_chunk["audio_data"],
+                                chunk_index=chunk_counter,
+                                is_final=audio_chunk["is_final"]
+                            ), chunk_index=chunk_counter)
+                            spoken_response = _join_spoken(spoken_response, audio_chunk["text"])
+                            if playback is not None and audio_chunk["audio_data"]:
+                                playback.add(audio_chunk["duration"])
+                            chunk_counter += 1
+                            
+                            # Small delay to prevent overwhelming the client
+                            await asyncio.sleep(0.05)
+                    finally:
+                        # Abandon any in-flight synthesis immediately
+                        await speech_stream.aclose()
+                
+                elif chunk["type"] == "error":
+                    log(f"Ollama error: {chunk['content']}")
+                    if full_response:
+                        await turn_stream.send_text(dumps({
+                            "type": "error",
+                            "content": chunk["content"]
+                        }))
+                    else:
+                        await send_fallback(turn_stream, conversation_id, voice)
+                    break
+        finally:
+            # Closing the generator closes the HTTP stream, which makes
+            # Ollama stop generating tokens nobody will hear
+            await chat_stream.aclose()
         
-        # Update conversation timestamp
-        conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-        if conversation:
-            conversation.updated_at = db.query(func.now()).scalar()
-            db.commit()
+        # Update assistant message with full content and the conversation summary
+        await db_writer.run(partial(_finish_message, assistant_message_id, conversation_id, full_response))
+        if conversation_memory is not None:
+            conversation_memory.remember_background(conversation_id, [(assistant_message_id, full_response)])
             
     except asyncio.CancelledError:
+        # Keep only what the user actually heard
+        db_writer.submit_background(partial(_save_partial_response, assistant_message_id, conversation_id, spoken_response))
+        if conversation_memory is not None:
+            conversation_memory.remember_background(conversation_id, [(assistant_message_id, spoken_response)])
         raise  # Re-raise to be handled by the caller
     except Exception as e:
-        print(f"Error in stream_response: {e}")
+        log(f"Error in stream_response: {e}")
         raise
 
+async def _chat_with_escalation(ollama_messages: list, conversation_id: str, profile: GenerationProfile = None):
+    """Stream from Ollama; if a routed profile fails before answering, retry on the default one."""
+    while True:
+        answered = False
+        stream = ollama_service.stream_chat(ollama_messages, conversation_id, profile=profile)
+        try:
+            async for chunk in stream:
+                if chunk["type"] == "error" and not answered and not chunk.get("unavailable") and profile is not None:
+                    escalated = model_router.escalate(profile)
+                    if escalated is not None:
+                        log(f"Profile {profile.name} failed ({chunk['content']}), escalating to {escalated.name}")
+                        metrics.increment("routing.escalated")
+                        profile = escalated
+                        break
+                answered = answered or chunk["type"] == "chunk"
+                yield chunk
+            else:
+                return
+        finally:
+            await stream.aclose()
+
+_fallback_audio: Dict[str, str] = {}
+
+async def send_fallback(turn_stream: TurnStream, conversation_id: str, voice: str):
+    """Speak FALLBACK_MESSAGE (text only if TTS is down too); not persisted."""
+    audio_data = _fallback_audio.get(voice)
+    if audio_data is None:
+        audio_data = await tts_service.text_to_speech_chunk(FALLBACK_MESSAGE, voice)
+        if audio_data:
+            _fallback_audio[voice] = audio_data
+    metrics.increment("chat.fallback")
+    await turn_stream.send_text(dumps({
+        "type": "chat_response",
+        "message_id": str(uuid.uuid4()),
+        "content": FALLBACK_MESSAGE,
+        "conversation_id": conversation_id,
+        "audio_data": audio_data or None,
+        "chunk_index": 0,
+        "is_final": True,
+        "fallback": True
+    }))
+
+def _join_spoken(spoken: str, sentence: str) -> str:
+    """Append a spoken sentence to the partial answer."""
+    if not spoken:
+        return sentence
+    return f"{spoken} {sentence}"
+
+# Write jobs - run on the database writer with its session
+
+def _insert_conversation(conversation_id: str, title: str, session) -> dict:
+    conversation = Conversation(id=conversation_id, title=title)
+    session.add(conversation)
+    session.flush()
+    session.refresh(conversation)
+    return {
+        "id": conversation.id,
+        "title": conversation.title,
+        "created_at": conversation.created_at,
+        "updated_at": conversation.updated_at,
+        "message_count": conversation.message_count,
+        "last_message_snippet": conversation.last_message_snippet,
+        "last_role": conversation.last_role,
+        "audio_bytes": conversation.audio_bytes,
+        "profile": conversation.profile
+    }
+
+def _set_conversation_profile(conversation_id: str, profile, session) -> bool:
+    updated = session.query(Conversation).filter(Conversation.id == conversation_id).update(
+        {Conversation.profile: profile, Conversation.updated_at: Conversation.updated_at},
+        synchronize_session=False
+    )
+    return updated > 0
+
+def _insert_user_message(conversation_id: str, title, content: str, session):
+    if title is not None:
+        session.add(Conversation(id=conversation_id, title=title))
+    message_id = str(uuid.uuid4())
+    session.add(Message(
+        id=message_id,
+        conversation_id=conversation_id,
+        content=content,
+        role="user"
+    ))
+    session.flush()
+    index_messages(session, [message_id])
+    record_message(session, conversation_id, "user", content)
+    return message_id
+
+def _insert_assistant_message(message_id: str, conversation_id: str, text_first: bool, session):
+    # Counted now; it becomes the latest message once its content is known
+    session.add(Message(
+        id=message_id, conversation_id=conversation_id, content="", role="assistant", text_first=text_first
+    ))
+    record_message(session, conversation_id, "assistant")
+
+def _add_audio_chunk(conversation_id: str, chunk: AudioChunk, session):
+    session.add(chunk)
+    record_audio(session, len(chunk.audio_data), conversation_id=conversation_id, message_id=chunk.message_id)
+
+def _finish_message(message_id: str, conversation_id: str, content: str, session):
+    # Bulk updates don't autoflush; the message row may still be pending in this batch
+    session.flush()
+    session.query(Message).filter(Message.id == message_id).update(
+        {Message.content: content}, synchronize_session=False
+    )
+    record_latest(session, conversation_id, "assistant", content)
+    index_messages(session, [message_id])
+
+def _save_partial_response(message_id: str, conversation_id: str, spoken_response: str, session):
+    """Persist the spoken part of a cancelled answer (or drop it if nothing was heard)."""
+    session.flush()
+    if spoken_response:
+        session.query(Message).filter(Message.id == message_id).update(
+            {Message.content: spoken_response}, synchronize_session=False
+        )
+        record_latest(session, conversation_id, "assistant", spoken_response)
+        index_messages(session, [message_id])
+    else:
+        audio_bytes = session.query(func.coalesce(func.sum(func.length(AudioChunk.audio_data)), 0)).filter(
+            AudioChunk.message_id == message_id
+        ).scalar()
+        session.query(AudioChunk).filter(AudioChunk.message_id == message_id).delete(synchronize_session=False)
+        deleted = session.query(Message).filter(Message.id == message_id).delete(synchronize_session=False)
+        if deleted:
+            record_removed_message(session, conversation_id, audio_bytes)
+
+async def handle_resume(websocket: WebSocket, message_data: dict, client_id: str):
+    """Pick up a turn after a reconnect: replay the frames the client missed, then go live."""
+    stream_id = message_data.get("stream_id")
+    turn_stream = turn_streams.get(stream_id)
+    if turn_stream is not None and turn_stream.client_id == client_id:
+        await websocket.send_text(dumps({
+            "type": "resumed",
+            "stream_id": stream_id,
+            "live": not turn_stream.finished
+        }))
+        if turn_stream.playback is not None:
+            manager.playback[client_id] = turn_stream.playback
+        replayed = await turn_stream.attach(
+            websocket,
+            last_seq=message_data.get("last_seq"),
+            last_chunk_index=message_data.get("last_chunk_index")
+        )
+        print(f"Resumed stream {stream_id} for client {client_id}: replayed {replayed} frame(s)")
+        return
+
+    # The buffer is gone (expired, or the turn ran on another worker): replay what was persisted
+    metrics.increment("streams.resumed_from_db")
+    loop = asyncio.get_running_loop()
+    message, chunks = await loop.run_in_executor(
+        None, _load_resume, message_data.get("message_id"), message_data.get("last_chunk_index")
+    )
+    if message is not None and not message["content"]:
+        # Still generating on another worker (content is written when the answer finishes):
+        # only that worker can continue it live, so have the client reconnect and try again
+        metrics.increment("streams.resume_retry")
+        await websocket.send_text(dumps({
+            "type": "resumed",
+            "stream_id": stream_id,
+            "live": False,
+            "found": True,
+            "retry": True,
+            "retry_after_ms": RECONNECT_DELAY_MS
+        }))
+        return
+    await websocket.send_text(dumps({
+        "type": "resumed",
+        "stream_id": stream_id,
+        "live": False,
+        "found": message is not None
+    }))
+    for chunk_index, audio_data, is_final in chunks:
+        await websocket.send_text(dumps({
+            "type": "chat_response",
+            "message_id": message["id"],
+            "conversation_id": message["conversation_id"],
+            "content": message["content"],
+            "audio_data": audio_data,
+            "chunk_index": chunk_index,
+            "is_final": is_final,
+            "replayed": True
+        }))
+
+def _load_resume(message_id: str, last_chunk_index: int = None):
+    """A message and its persisted ``(chunk_index, audio_data, is_final)`` after ``last_chunk_index``."""
+    if not message_id:
+        return None, []
+    db = next(get_db())
+    try:
+        message = db.query(Message).filter(Message.id == message_id).first()
+        if message is None:
+            return None, []
+        query = db.query(AudioChunk.chunk_index, AudioChunk.audio_data, AudioChunk.is_final).filter(
+            AudioChunk.message_id == message_id
+        )
+        if isinstance(last_chunk_index, int):
+            query = query.filter(AudioChunk.chunk_index > last_chunk_index)
+        chunks = [tuple(row) for row in query.order_by(AudioChunk.chunk_index).all()]
+        return {"id": message.id, "conversation_id": message.conversation_id, "content": message.content}, chunks
+    finally:
+        db.close()
+
+async def handle_session_settings(websocket: WebSocket, message_data: dict, client_id: str):
+    """Switch the session between spoken answers and text-first (audio on request)."""
+    text_first = bool(message_data.get("text_first", False))
+    manager.text_first[client_id] = text_first
+    await websocket.send_text(dumps({
+        "type": "session_settings_updated",
+        "text_first": text_first
+    }))
+
+_audio_requests = set()
+
+async def handle_audio_request(websocket: WebSocket, message_data: dict, client_id: str):
+    """Send a message's audio, synthesizing (once) whatever is not persisted yet."""
+    message_id = message_data.get("message_id")
+    chunk_index = message_data.get("chunk_index")
+    voice = message_data.get("voice") or tts_service.voice
+    if chunk_index is not None and (not isinstance(chunk_index, int) or isinstance(chunk_index, bool)):
+        await websocket.send_text(dumps({
+            "type": "error",
+            "content": "chunk_index must be an integer"
+        }))
+        return
+    loop = asyncio.get_running_loop()
+    content, text_first, persisted = await loop.run_in_executor(None, _load_message_audio, message_id)
+    if not content or not (text_first or persisted):
+        await websocket.send_text(dumps({
+            "type": "error",
+            "content": f"No audio available for message {message_id}"
+        }))
+        return
+    
+    if not text_first:
+        # Spoken when it was generated: chunks are per streamed phrase, not per
+        # sentence of the content, so they can only be served as stored
+        last = max(persisted)
+        for index in sorted(persisted):
+            if chunk_index is None or index == chunk_index:
+                await websocket.send_text(dumps({
+                    "type": "audio",
+                    "message_id": message_id,
+                    "chunk_index": index,
+                    "audio_data": persisted[index],
+                    "is_final": index == last
+                }))
+        return
+    
+    sentences = tts_service.split_into_sentences(content)
+    last = len(sentences) - 1
+    if chunk_index is None:
+        indices = list(range(len(sentences)))
+    else:
+        indices = [chunk_index] if 0 <= chunk_index <= last else []
+    lazy_audio.prime(message_id, persisted)
+    # Synthesize ahead (the TTS scheduler bounds concurrency) but send in order
+    pending = [
+        asyncio.ensure_future(lazy_audio.sentence_audio(
+            message_id, index, sentences[index], voice, is_final=index == last
+        ))
+        for index in indices
+    ]
+    try:
+        for index, audio in zip(indices, pending):
+            audio_data = await audio
+            await websocket.send_text(dumps({
+                "type": "audio",
+                "message_id": message_id,
+                "chunk_index": index,
+                "audio_data": audio_data or None,
+                "is_final": index == last
+            }))
+    finally:
+        for audio in pending:
+            audio.cancel()
+
+def _load_message_audio(message_id: str):
+    """Content, text-first flag and persisted audio chunks ``{chunk_index: audio}`` of a message."""
+    db = next(get_db())
+    try:
+        message = db.query(Message).filter(Message.id == message_id).first()
+        if message is None:
+            return None, False, {}
+        chunks = db.query(AudioChunk.chunk_index, AudioChunk.audio_data).filter(
+            AudioChunk.message_id == message_id
+        ).all()
+        return message.content, message.text_first, {index: audio_data for index, audio_data in chunks}
+    finally:
+        db.close()
+
+def _persist_lazy_audio(message_id: str, chunk_index: int, audio_data: str, is_final: bool):
+    db_writer.submit_background(partial(_add_audio_chunk, None, AudioChunk(
+        id=str(uuid.uuid4()),
+        message_id=message_id,
+        chunk_index=chunk_index,
+        audio_data=audio_data,
+        is_final=is_final
+    )))
+
 async def handle_voice_settings(websocket: WebSocket, message_data: dict, client_id: str):
     """Handle voice settings updates."""
     voice = message_data.get("voice", "en-US-JennyNeural")
     tts_service.voice = voice
     
-    await websocket.send_text(json.dumps({
+    await websocket.send_text(dumps({
         "type": "voice_settings_updated",
         "voice": voice
     }))
 
 async def handle_stop_streaming(websocket: WebSocket, message_data: dict, client_id: str):
     """Handle stop streaming request."""
-    manager.stop_streaming(client_id)
-    await websocket.send_text(json.dumps({
+    await manager.cancel_turn(client_id, reason="stop")
+    await websocket.send_text(dumps({
         "type": "stop_streaming_response",
         "status": "streaming_stopped"
     }))
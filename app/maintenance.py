@@ -0,0 +1,315 @@
+"""
+Audio retention, archival and database compaction.
+
+``audio_chunks`` grows by several base64 rows per assistant answer. This
+module trims it according to configurable retention policies:
+
+- AUDIO_RETENTION_DAYS            drop audio older than N days
+- AUDIO_KEEP_PER_CONVERSATION     keep audio for the N most recent answers
+                                  of each conversation
+- AUDIO_MAX_TOTAL_BYTES           drop the oldest audio once the table holds
+                                  more than this many (base64) bytes
+
+Expired chunks are appended to a gzip-compressed NDJSON bundle per
+conversation under AUDIO_ARCHIVE_DIR (empty to delete without archiving)
+and removed in small batches, each in its own short transaction.
+ANALYZE runs after every pass and VACUUM every VACUUM_INTERVAL_HOURS.
+
+Run once from the command line with ``python -m app.maintenance`` or enable
+the background job with MAINTENANCE_ENABLED=1 (in a single worker only).
+"""
+
+import asyncio
+import gzip
+import hashlib
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import func, text
+
+from .database import engine, db_writer, ReadSessionLocal, Message, AudioChunk, DATABASE_URL
+from .serialization import dumps
+from .summaries import record_audio
+
+_SAFE_NAME = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name, "").strip()
+    return int(value) if value else None
+
+
+class RetentionPolicy:
+    """Retention settings; ``None`` disables a rule."""
+
+    def __init__(
+        self,
+        max_age_days: Optional[int] = None,
+        keep_per_conversation: Optional[int] = None,
+        max_total_bytes: Optional[int] = None,
+        archive_dir: Optional[str] = "archive",
+        batch_size: int = 500,
+        batch_pause: float = 0.05,
+        vacuum_interval_hours: Optional[float] = 24,
+    ):
+        self.max_age_days = max_age_days
+        self.keep_per_conversation = keep_per_conversation
+        self.max_total_bytes = max_total_bytes
+        self.archive_dir = archive_dir or None
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.vacuum_interval_hours = vacuum_interval_hours
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        vacuum_hours = os.getenv("VACUUM_INTERVAL_HOURS", "24").strip()
+        return cls(
+            max_age_days=_env_int("AUDIO_RETENTION_DAYS"),
+            keep_per_conversation=_env_int("AUDIO_KEEP_PER_CONVERSATION"),
+            max_total_bytes=_env_int("AUDIO_MAX_TOTAL_BYTES"),
+            archive_dir=os.getenv("AUDIO_ARCHIVE_DIR", "archive"),
+            batch_size=int(os.getenv("MAINTENANCE_BATCH_SIZE", "500")),
+            batch_pause=float(os.getenv("MAINTENANCE_BATCH_PAUSE", "0.05")),
+            vacuum_interval_hours=float(vacuum_hours) if vacuum_hours else None,
+        )
+
+
+class AudioMaintenance:
+    """Applies a RetentionPolicy to the audio_chunks table."""
+
+    def __init__(self, policy: RetentionPolicy = None):
+        self.policy = policy or RetentionPolicy.from_env()
+        self.last_vacuum = None
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    def run(self, vacuum: Optional[bool] = None) -> Dict[str, Any]:
+        """Run one maintenance pass (blocking) and return what was reclaimed."""
+        started = time.perf_counter()
+        report = {
+            "started_at": datetime.utcnow().isoformat(),
+            "deleted_chunks": 0,
+            "deleted_bytes": 0,
+            "archived_conversations": 0,
+            "by_policy": {},
+            "db_size_before": self._db_size(),
+        }
+        archived = set()
+
+        db = ReadSessionLocal()
+        try:
+            if self.policy.max_age_days is not None:
+                self._apply(db, "age", self._expired_by_age, report, archived)
+            if self.policy.keep_per_conversation is not None:
+                self._apply(db, "per_conversation", self._expired_by_rank, report, archived)
+            if self.policy.max_total_bytes is not None:
+                self._apply_size_limit(db, report, archived)
+        finally:
+            db.close()
+
+        report["archived_conversations"] = len(archived)
+        if vacuum is None:
+            vacuum = self._vacuum_due()
+        self._compact(vacuum)
+        report["vacuumed"] = vacuum
+        report["db_size_after"] = self._db_size()
+        report["duration_seconds"] = round(time.perf_counter() - started, 3)
+        self.last_report = report
+        return report
+
+    # Candidate selection - each returns up to batch_size chunk ids
+
+    def _expired_by_age(self, db) -> List[str]:
+        cutoff = datetime.utcnow() - timedelta(days=self.policy.max_age_days)
+        rows = (
+            db.query(AudioChunk.id)
+            .filter(AudioChunk.created_at < cutoff)
+            .order_by(AudioChunk.created_at)
+            .limit(self.policy.batch_size)
+            .all()
+        )
+        return [row.id for row in rows]
+
+    def _expired_by_rank(self, db) -> List[str]:
+        ranked = (
+            db.query(
+                Message.id.label("message_id"),
+                func.row_number().over(
+                    partition_by=Message.conversation_id,
+                    order_by=Message.created_at.desc(),
+                ).label("rank"),
+            )
+            .filter(Message.role == "assistant")
+            .subquery()
+        )
+        rows = (
+            db.query(AudioChunk.id)
+            .join(ranked, ranked.c.message_id == AudioChunk.message_id)
+            .filter(ranked.c.rank > self.policy.keep_per_conversation)
+            .limit(self.policy.batch_size)
+            .all()
+        )
+        return [row.id for row in rows]
+
+    def _apply(self, db, name: str, select_batch, report: Dict[str, Any], archived: set):
+        deleted = 0
+        while True:
+            chunk_ids = select_batch(db)
+            if not chunk_ids:
+                break
+            count, size = self._archive_and_delete(db, chunk_ids, archived)
+            deleted += count
+            report["deleted_chunks"] += count
+            report["deleted_bytes"] += size
+            if len(chunk_ids) < self.policy.batch_size:
+                break
+            time.sleep(self.policy.batch_pause)
+        report["by_policy"][name] = deleted
+
+    def _apply_size_limit(self, db, report: Dict[str, Any], archived: set):
+        total = db.query(func.coalesce(func.sum(func.length(AudioChunk.audio_data)), 0)).scalar()
+        excess = total - self.policy.max_total_bytes
+        deleted = 0
+        while excess > 0:
+            rows = (
+                db.query(AudioChunk.id, func.length(AudioChunk.audio_data).label("size"))
+                .order_by(AudioChunk.created_at)
+                .limit(self.policy.batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            chunk_ids = []
+            for row in rows:
+                chunk_ids.append(row.id)
+                excess -= row.size
+                if excess <= 0:
+                    break
+            count, size = self._archive_and_delete(db, chunk_ids, archived)
+            deleted += count
+            report["deleted_chunks"] += count
+            report["deleted_bytes"] += size
+            time.sleep(self.policy.batch_pause)
+        report["by_policy"]["total_size"] = deleted
+
+    def _archive_and_delete(self, db, chunk_ids: List[str], archived: set):
+        """Archive one batch of chunks, then delete it in a single short write transaction."""
+        rows = (
+            db.query(
+                AudioChunk.id,
+                AudioChunk.message_id,
+                Message.conversation_id,
+                AudioChunk.chunk_index,
+                AudioChunk.audio_data,
+                AudioChunk.is_final,
+                AudioChunk.created_at,
+            )
+            .outerjoin(Message, Message.id == AudioChunk.message_id)
+            .filter(AudioChunk.id.in_(chunk_ids))
+            .all()
+        )
+        size = sum(len(row.audio_data) for row in rows)
+
+        bundles: Dict[str, str] = {}
+        if self.policy.archive_dir:
+            bundles = self._write_bundles(rows)
+            archived.update(bundles)
+
+        # End the read transaction so it doesn't pin the WAL while we write
+        db.rollback()
+
+        freed: Dict[str, int] = {}
+        for row in rows:
+            if row.conversation_id is not None:
+                freed[row.conversation_id] = freed.get(row.conversation_id, 0) + len(row.audio_data)
+
+        def delete_batch(session):
+            session.query(AudioChunk).filter(AudioChunk.id.in_(chunk_ids)).delete(synchronize_session=False)
+            for conversation_id, freed_bytes in freed.items():
+                record_audio(session, -freed_bytes, conversation_id=conversation_id)
+            # Point messages at the bundle that now holds their audio
+            for row in rows:
+                if row.conversation_id in bundles:
+                    session.query(Message).filter(Message.id == row.message_id).update(
+                        {Message.audio_file_path: bundles[row.conversation_id]},
+                        synchronize_session=False,
+                    )
+
+        db_writer.submit(delete_batch).result()
+        return len(rows), size
+
+    def _bundle_path(self, conversation_id: str) -> str:
+        # Ids come from clients and imports; anything else would escape archive_dir
+        if _SAFE_NAME.fullmatch(conversation_id):
+            name = conversation_id
+        else:
+            name = hashlib.sha1(conversation_id.encode()).hexdigest()
+        return os.path.join(self.policy.archive_dir, f"{name}.ndjson.gz")
+
+    def _write_bundles(self, rows) -> Dict[str, str]:
+        """Append rows to gzip NDJSON bundles, one per conversation."""
+        os.makedirs(self.policy.archive_dir, exist_ok=True)
+        grouped: Dict[str, list] = {}
+        for row in rows:
+            grouped.setdefault(row.conversation_id or "orphaned", []).append(row)
+
+        bundles = {}
+        for conversation_id, conversation_rows in grouped.items():
+            path = self._bundle_path(conversation_id)
+            # Each append adds a gzip member; gzip.open reads them back as one stream
+            with gzip.open(path, "at", encoding="utf-8") as bundle:
+                for row in conversation_rows:
+                    bundle.write(dumps({
+                        "id": row.id,
+                        "message_id": row.message_id,
+                        "conversation_id": row.conversation_id,
+                        "chunk_index": row.chunk_index,
+                        "audio_data": row.audio_data,
+                        "is_final": row.is_final,
+                        "created_at": row.created_at.isoformat() if row.created_at else None,
+                    }) + "\n")
+            bundles[conversation_id] = path
+        return bundles
+
+    def _vacuum_due(self) -> bool:
+        if self.policy.vacuum_interval_hours is None:
+            return False
+        if self.last_vacuum is None:
+            return True
+        return time.time() - self.last_vacuum >= self.policy.vacuum_interval_hours * 3600
+
+    def _compact(self, vacuum: bool):
+        # VACUUM cannot run inside a transaction on SQLite or PostgreSQL
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if vacuum:
+                conn.execute(text("VACUUM"))
+                self.last_vacuum = time.time()
+            conn.execute(text("ANALYZE"))
+
+    def _db_size(self) -> Optional[int]:
+        if DATABASE_URL.startswith("sqlite:///"):
+            path = DATABASE_URL[len("sqlite:///"):]
+            if os.path.exists(path):
+                return os.path.getsize(path)
+            return None
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT pg_database_size(current_database())")).scalar()
+
+
+async def run_periodically(maintenance: AudioMaintenance, interval: float):
+    """Background loop; each pass runs in a worker thread off the event loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            report = await loop.run_in_executor(None, maintenance.run)
+            print(f"Audio maintenance: reclaimed {report['deleted_chunks']} chunks "
+                  f"({report['deleted_bytes']} bytes)")
+        except Exception as e:
+            print(f"Audio maintenance failed: {e}")
+
+
+if __name__ == "__main__":
+    print(dumps(AudioMaintenance(RetentionPolicy.from_env()).run()))
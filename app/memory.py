@@ -0,0 +1,289 @@
+"""
+Retrieval memory over long conversation history.
+
+Instead of sending a conversation's full history to Ollama, only the most
+recent messages are sent together with the few older messages most similar
+to the new utterance.
+
+Every stored message is embedded (Ollama ``/api/embed`` by default) and
+appended to a per-conversation matrix on disk::
+
+    MEMORY_DIR/<conversation_id>/vectors.f16   N x dim float16, row-major
+    MEMORY_DIR/<conversation_id>/ids.txt       one message id per row
+    MEMORY_DIR/<conversation_id>/meta.json     {"dim": ..., "model": ...}
+
+Rows are unit-normalized, so recall is one memory-mapped float16 matrix
+times the query vector (cosine similarity) and an ``argpartition`` for the
+top k. Appends are serialized per conversation, across worker processes
+too (``flock`` on the conversation's ``lock`` file). The ids file is written
+after the vectors, so a crash in between can leave trailing vector rows (or
+a partial id line) without an id; both are cut off before the next append,
+and searches only map the first ``len(ids)`` rows. Message ids already
+stored are skipped, so indexing the same message twice is harmless.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+
+from .metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: single process, the asyncio lock is enough
+    fcntl = None
+
+BACKFILL_RETRY_SECONDS = 60.0
+
+_SAFE_NAME = re.compile(r"[A-Za-z0-9_-]{1,64}")
+_WORD = re.compile(r"\w+")
+
+
+class OllamaEmbedder:
+    """Embeddings from Ollama's ``/api/embed`` endpoint."""
+
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "nomic-embed-text",
+                 timeout: float = 30.0):
+        self.base_url = base_url
+        self.model = model
+        self.client = httpx.AsyncClient(timeout=timeout)
+
+    async def embed(self, texts: Sequence[str]):
+        import numpy as np
+        response = await self.client.post(
+            f"{self.base_url}/api/embed", json={"model": self.model, "input": list(texts)}
+        )
+        response.raise_for_status()
+        return np.asarray(response.json()["embeddings"], dtype=np.float32)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class HashEmbedder:
+    """Deterministic bag-of-words embedder (feature hashing); no model needed.
+
+    Only catches lexical overlap, but keeps memory usable offline and in tests.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.model = f"hash-{dim}"
+
+    async def embed(self, texts: Sequence[str]):
+        import numpy as np
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in _WORD.findall(text.lower()):
+                digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        return vectors
+
+    async def close(self):
+        pass
+
+
+class ConversationMemory:
+    def __init__(self, directory: str, embedder, top_k: int = 4, min_score: float = 0.3):
+        self.directory = directory
+        self.embedder = embedder
+        self.top_k = top_k
+        self.min_score = min_score
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._tasks = set()
+        self._backfilling = set()
+        self._backfill_failed: Dict[str, float] = {}  # conversation_id -> time.monotonic()
+        import numpy
+        self._np = numpy
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, conversation_id: str, name: str) -> str:
+        if _SAFE_NAME.fullmatch(conversation_id):
+            folder = conversation_id
+        else:
+            folder = hashlib.sha1(conversation_id.encode()).hexdigest()
+        return os.path.join(self.directory, folder, name)
+
+    def _normalize(self, vectors):
+        np = self._np
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _read_ids(self, conversation_id: str) -> List[str]:
+        try:
+            with open(self._path(conversation_id, "ids.txt")) as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        # A line without its newline is a write that never finished
+        return data[:data.rfind("\n") + 1].split()
+
+    @contextmanager
+    def _file_lock(self, conversation_id: str):
+        path = self._path(conversation_id, "lock")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def count(self, conversation_id: str) -> int:
+        return len(self._read_ids(conversation_id))
+
+    def _append(self, conversation_id: str, message_ids: List[str], vectors) -> int:
+        """Append rows for ids not stored yet (runs in a worker thread); returns rows written."""
+        with self._file_lock(conversation_id):
+            return self._append_locked(conversation_id, message_ids, vectors)
+
+    def _append_locked(self, conversation_id: str, message_ids: List[str], vectors) -> int:
+        meta_path = self._path(conversation_id, "meta.json")
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["dim"] != vectors.shape[1]:
+                raise ValueError(f"embedding size changed from {meta['dim']} to {vectors.shape[1]}")
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"dim": int(vectors.shape[1]), "model": self.embedder.model}, f)
+
+        ids = self._read_ids(conversation_id)
+        stored = set(ids)
+        rows = [row for row, message_id in enumerate(message_ids) if message_id not in stored]
+        if not rows:
+            return 0
+        # Drop whatever an interrupted append left behind, so row i stays ids[i]
+        ids_path = self._path(conversation_id, "ids.txt")
+        if os.path.exists(ids_path):
+            os.truncate(ids_path, sum(len(message_id) + 1 for message_id in ids))
+        with open(self._path(conversation_id, "vectors.f16"), "ab") as f:
+            f.truncate(len(ids) * vectors.shape[1] * 2)
+            f.write(self._np.ascontiguousarray(vectors[rows], dtype=self._np.float16).tobytes())
+        with open(ids_path, "a") as f:
+            f.write("".join(f"{message_ids[row]}\n" for row in rows))
+        return len(rows)
+
+    async def remember(self, conversation_id: str, messages: Sequence[tuple]) -> bool:
+        """Embed and store ``(message_id, text)`` pairs, in order; False if embedding failed."""
+        messages = [(message_id, text) for message_id, text in messages if text and text.strip()]
+        if not messages:
+            return True
+        lock = self._locks.setdefault(conversation_id, asyncio.Lock())
+        async with lock:
+            try:
+                vectors = self._normalize(await self.embedder.embed([text for _, text in messages]))
+                loop = asyncio.get_running_loop()
+                written = await loop.run_in_executor(
+                    None, self._append, conversation_id, [message_id for message_id, _ in messages], vectors
+                )
+                metrics.increment("memory.embedded", written)
+                return True
+            except Exception as e:
+                metrics.increment("memory.embed_failed")
+                print(f"Could not embed messages for conversation {conversation_id}: {e}")
+                return False
+
+    def remember_background(self, conversation_id: str, messages: Sequence[tuple]):
+        """Fire-and-forget ``remember``; the turn does not wait for embedding."""
+        task = asyncio.create_task(self.remember(conversation_id, messages))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def backfill_background(self, conversation_id: str, messages: Sequence[tuple]):
+        """Index a conversation's existing history once.
+
+        No-op while a backfill for the conversation is running, and for
+        ``BACKFILL_RETRY_SECONDS`` after one failed (e.g. the embedding model
+        is missing), so turns don't each queue the whole history again.
+        """
+        failed_at = self._backfill_failed.get(conversation_id)
+        if conversation_id in self._backfilling or (
+            failed_at is not None and time.monotonic() - failed_at < BACKFILL_RETRY_SECONDS
+        ):
+            return
+        self._backfilling.add(conversation_id)
+
+        async def run():
+            try:
+                if await self.remember(conversation_id, messages):
+                    self._backfill_failed.pop(conversation_id, None)
+                else:
+                    self._backfill_failed[conversation_id] = time.monotonic()
+            finally:
+                self._backfilling.discard(conversation_id)
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _search(self, conversation_id: str, query, k: int, exclude: set) -> List[str]:
+        np = self._np
+        ids = self._read_ids(conversation_id)
+        if not ids:
+            return []
+        with open(self._path(conversation_id, "meta.json")) as f:
+            dim = json.load(f)["dim"]
+        if query.shape[0] != dim:
+            return []
+        matrix = np.memmap(self._path(conversation_id, "vectors.f16"), dtype=np.float16, mode="r",
+                           shape=(len(ids), dim))
+        # One vectorized product over all rows; float32 accumulation
+        scores = matrix.astype(np.float32) @ query
+        if exclude:
+            scores[[row for row, message_id in enumerate(ids) if message_id in exclude]] = -np.inf
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [ids[row] for row in top if scores[row] >= self.min_score]
+
+    async def recall(self, conversation_id: str, query: str, exclude: Sequence[str] = (),
+                     k: int = None) -> List[str]:
+        """Ids of the stored messages most similar to ``query``, best first."""
+        if not query.strip():
+            return []
+        try:
+            vector = self._normalize(await self.embedder.embed([query]))[0]
+        except Exception as e:
+            metrics.increment("memory.embed_failed")
+            print(f"Could not embed query for conversation {conversation_id}: {e}")
+            return []
+        loop = asyncio.get_running_loop()
+        with metrics.timer("memory.recall"):
+            return await loop.run_in_executor(
+                None, self._search, conversation_id, vector, k or self.top_k, set(exclude)
+            )
+
+    async def close(self):
+        await self.embedder.close()
+
+
+def memory_from_env(base_url: str) -> Optional[ConversationMemory]:
+    """ConversationMemory from MEMORY_* settings, or None if disabled or NumPy is missing."""
+    if os.getenv("MEMORY_ENABLED", "0").lower() not in ("1", "true", "yes"):
+        return None
+    if os.getenv("MEMORY_EMBEDDER", "ollama") == "hash":
+        embedder = HashEmbedder()
+    else:
+        embedder = OllamaEmbedder(base_url, os.getenv("MEMORY_EMBED_MODEL", "nomic-embed-text"))
+    try:
+        return ConversationMemory(
+            os.getenv("MEMORY_DIR", "memory"),
+            embedder,
+            top_k=int(os.getenv("MEMORY_TOP_K", "4")),
+            min_score=float(os.getenv("MEMORY_MIN_SCORE", "0.3")),
+        )
+    except ImportError as e:
+        print(f"Retrieval memory disabled: {e}")
+        return None
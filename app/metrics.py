@@ -0,0 +1,74 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Any
+
+
+class Timing:
+    """Running summary of a latency measurement (seconds)."""
+
+    __slots__ = ("count", "total", "min", "max", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.last = None
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.last = value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else None,
+            "min_ms": round(self.min * 1000, 3) if self.min is not None else None,
+            "max_ms": round(self.max * 1000, 3) if self.max is not None else None,
+            "last_ms": round(self.last * 1000, 3) if self.last is not None else None,
+        }
+
+
+class Metrics:
+    """In-process counters, gauges and timings exposed on /metrics."""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, Any] = {}
+        self.timings: Dict[str, Timing] = {}
+
+    def increment(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: Any):
+        self.gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        timing = self.timings.get(name)
+        if timing is None:
+            timing = self.timings[name] = Timing()
+        timing.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Record the duration of a ``with`` block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "timings": {name: timing.to_dict() for name, timing in self.timings.items()},
+        }
+
+
+metrics = Metrics()
@@ -23,6 +23,11 @@ class ConversationResponse(BaseModel):
     title: Optional[str]
     created_at: datetime
     updated_at: datetime
+    message_count: int = 0
+    last_message_snippet: Optional[str] = None
+    last_role: Optional[str] = None
+    audio_bytes: int = 0
+    profile: Optional[str] = None
 
 class MessageResponse(BaseModel):
     id: str
@@ -38,6 +43,9 @@ class AudioChunkResponse(BaseModel):
     is_final: bool
     created_at: datetime
 
+class ProfileOverride(BaseModel):
+    profile: Optional[str] = None  # None returns the conversation to automatic routing
+
 class VoiceSettings(BaseModel):
     voice: str = "en-US-JennyNeural"
 
@@ -1,78 +1,196 @@
 import httpx
-import json
 import asyncio
-from typing import AsyncGenerator, Dict, Any
+import time
+from typing import AsyncGenerator, AsyncIterator, Dict, Any
 import re
 
+from .health import CircuitBreaker
+from .metrics import metrics
+from .prompt_cache import PromptCache
+from .routing import GenerationProfile
+from .serialization import iter_ndjson
+
+class OllamaTimeoutError(Exception):
+    """Ollama stopped producing tokens within the configured timeout."""
+
 class OllamaService:
-    def __init__(self, base_url: str = "http://localhost:11434", model: str = "mistral"):
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "mistral",
+                 connect_timeout: float = 5.0, first_token_timeout: float = 60.0,
+                 inter_token_timeout: float = 15.0, retries: int = 1, breaker: CircuitBreaker = None,
+                 prompt_cache: PromptCache = None):
         self.base_url = base_url
         self.model = model
-        self.client = httpx.AsyncClient(timeout=30.0)
+        self.default_profile = GenerationProfile("default", model)
+        self.first_token_timeout = first_token_timeout
+        self.inter_token_timeout = inter_token_timeout
+        self.retries = retries
+        self.breaker = breaker or CircuitBreaker("ollama")
+        self.prompt_cache = prompt_cache  # keeps each conversation's prompt append-only
+        self.last_used: Dict[str, float] = {}  # model -> time.monotonic() of last chat request
+        # httpx's read timeout only bounds waiting for response headers here;
+        # token gaps are enforced separately in _read_with_timeouts
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(
+            connect=connect_timeout,
+            read=max(first_token_timeout, inter_token_timeout),
+            write=10.0,
+            pool=connect_timeout
+        ))
     
-    async def stream_chat(self, messages: list, conversation_id: str = None) -> AsyncGenerator[Dict[str, Any], None]:
-        """Stream chat responses from Ollama Mistral model."""
-        try:
-            # Prepare the request payload
-            payload = {
-                "model": self.model,
-                "messages": messages,
-                "stream": True,
-                "options": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "num_predict": 2048
-                }
+    async def stream_chat(self, messages: list, conversation_id: str = None,
+                          profile: GenerationProfile = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """Stream chat responses using the given generation profile (default model otherwise).
+        
+        Fails fast while the circuit breaker is open, and retries connection
+        failures that happen before any token was produced.
+        """
+        if not self.breaker.allow():
+            yield {
+                "type": "error",
+                "content": "Ollama is currently unavailable",
+                "conversation_id": conversation_id,
+                "unavailable": True
             }
+            return
+        
+        # Prepare the request payload
+        payload = {
+            "messages": messages,
+            "stream": True,
+            **(profile or self.default_profile).request_fields()
+        }
+        self.last_used[payload["model"]] = time.monotonic()
+        if self.prompt_cache is not None:
+            payload["messages"], context = await self.prompt_cache.stable_messages(
+                conversation_id, payload["model"], messages
+            )
+            if context:
+                payload["context"] = context
+        
+        attempt = 0
+        produced = False
+        while True:
+            try:
+                async for item in self._stream_once(payload, conversation_id):
+                    produced = True
+                    yield item
+                self.breaker.record_success()
+                return
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                if not produced and attempt < self.retries:
+                    attempt += 1
+                    metrics.increment("ollama.retries")
+                    await asyncio.sleep(0.2 * 2 ** attempt)
+                    continue
+                error = e
+            except httpx.HTTPStatusError as e:
+                # 4xx (e.g. model not pulled) is a bad request, not an unhealthy server
+                if e.response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                yield {
+                    "type": "error",
+                    "content": f"Error communicating with Ollama: {str(e)}",
+                    "conversation_id": conversation_id,
+                    "status_code": e.response.status_code
+                }
+                return
+            except Exception as e:
+                error = e
             
-            # Make streaming request to Ollama
-            async with self.client.stream("POST", f"{self.base_url}/api/chat", json=payload) as response:
-                response.raise_for_status()
-                
-                current_chunk = ""
-                chunk_index = 0
-                
-                async for line in response.aiter_lines():
-                    if line.strip():
-                        try:
-                            data = json.loads(line)
-                            
-                            if "message" in data and "content" in data["message"]:
-                                content = data["message"]["content"]
-                                current_chunk += content
-                                
-                                # Check if we have a complete sentence or phrase
-                                if self._is_complete_chunk(current_chunk):
-                                    yield {
-                                        "type": "chunk",
-                                        "content": current_chunk,
-                                        "chunk_index": chunk_index,
-                                        "conversation_id": conversation_id,
-                                        "is_final": data.get("done", False)
-                                    }
-                                    current_chunk = ""
-                                    chunk_index += 1
-                                
-                                # If this is the final response, send any remaining content
-                                if data.get("done", False) and current_chunk.strip():
-                                    yield {
-                                        "type": "chunk",
-                                        "content": current_chunk,
-                                        "chunk_index": chunk_index,
-                                        "conversation_id": conversation_id,
-                                        "is_final": True
-                                    }
-                                    break
-                                    
-                        except json.JSONDecodeError:
-                            continue
-                            
-        except Exception as e:
+            self.breaker.record_failure()
             yield {
                 "type": "error",
-                "content": f"Error communicating with Ollama: {str(e)}",
+                "content": f"Error communicating with Ollama: {str(error)}",
                 "conversation_id": conversation_id
             }
+            return
+    
+    async def _read_with_timeouts(self, chunks: AsyncIterator[bytes], started: float) -> AsyncGenerator[bytes, None]:
+        """Enforce the first-token deadline, then a maximum gap between chunks."""
+        iterator = chunks.__aiter__()
+        first = True
+        while True:
+            if first:
+                timeout = self.first_token_timeout - (time.monotonic() - started)
+            else:
+                timeout = self.inter_token_timeout
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), timeout=max(timeout, 0.001))
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                metrics.increment("ollama.timeouts.first_token" if first else "ollama.timeouts.inter_token")
+                if first:
+                    raise OllamaTimeoutError(f"no first token within {self.first_token_timeout:g}s")
+                raise OllamaTimeoutError(f"no tokens for {self.inter_token_timeout:g}s")
+            if first:
+                metrics.observe("ollama.first_token", time.monotonic() - started)
+                first = False
+            yield chunk
+    
+    async def _stream_once(self, payload: dict, conversation_id: str) -> AsyncGenerator[Dict[str, Any], None]:
+        """One streaming request to /api/chat, yielding text chunks."""
+        started = time.monotonic()
+        # Make streaming request to Ollama
+        async with self.client.stream("POST", f"{self.base_url}/api/chat", json=payload) as response:
+            response.raise_for_status()
+            
+            current_chunk = ""
+            chunk_index = 0
+            reply = []
+            
+            async for data in iter_ndjson(self._read_with_timeouts(response.aiter_bytes(), started)):
+                if data.get("done", False):
+                    # Recorded before the last chunk is yielded; the caller may stop reading there
+                    reply.append(data.get("message", {}).get("content", ""))
+                    self._record_turn(payload, conversation_id, "".join(reply), data)
+                if "message" in data and "content" in data["message"]:
+                    content = data["message"]["content"]
+                    if not data.get("done", False):
+                        reply.append(content)
+                    current_chunk += content
+                    
+                    # Check if we have a complete sentence or phrase
+                    if self._is_complete_chunk(current_chunk):
+                        yield {
+                            "type": "chunk",
+                            "content": current_chunk,
+                            "chunk_index": chunk_index,
+                            "conversation_id": conversation_id,
+                            "is_final": data.get("done", False)
+                        }
+                        current_chunk = ""
+                        chunk_index += 1
+                    
+                    # If this is the final response, send any remaining content
+                    if data.get("done", False) and current_chunk.strip():
+                        yield {
+                            "type": "chunk",
+                            "content": current_chunk,
+                            "chunk_index": chunk_index,
+                            "conversation_id": conversation_id,
+                            "is_final": True
+                        }
+                        break
+    
+    def _record_turn(self, payload: dict, conversation_id: str, reply: str, final: Dict[str, Any]):
+        """Prompt-eval stats from the final frame; remember the prompt for the next turn."""
+        prompt_eval_count = final.get("prompt_eval_count")
+        if prompt_eval_count is not None:
+            metrics.increment("ollama.prompt_eval_tokens", prompt_eval_count)
+        if final.get("prompt_eval_duration") is not None:
+            metrics.observe("ollama.prompt_eval", final["prompt_eval_duration"] / 1e9)
+        metrics.set_gauge("ollama.last_prompt_eval", {
+            "model": payload["model"],
+            "messages": len(payload["messages"]),
+            "prompt_eval_count": prompt_eval_count,
+            "prompt_eval_ms": round(final.get("prompt_eval_duration", 0) / 1e6, 3),
+        })
+        if self.prompt_cache is not None:
+            self.prompt_cache.remember(
+                conversation_id, payload["model"], payload["messages"], reply, final.get("context")
+            )
     
     def _is_complete_chunk(self, text: str) -> bool:
         """Check if the text chunk is complete (ends with punctuation)."""
@@ -99,14 +217,25 @@ class OllamaService:
             
         return False
     
+    async def load_model(self, model: str, keep_alive: str = None) -> float:
+        """Load ``model`` into memory (or extend its keep_alive); returns seconds taken."""
+        payload = {"model": model}
+        if keep_alive:
+            payload["keep_alive"] = keep_alive
+        started = time.monotonic()
+        # A generate request without a prompt only loads the model
+        response = await self.client.post(f"{self.base_url}/api/generate", json=payload)
+        response.raise_for_status()
+        return time.monotonic() - started
+    
     async def close(self):
         """Close the HTTP client."""
         await self.client.aclose()
     
-    async def health_check(self) -> bool:
+    async def health_check(self, timeout: float = 2.0) -> bool:
         """Check if Ollama service is running."""
         try:
-            response = await self.client.get(f"{self.base_url}/api/tags")
+            response = await self.client.get(f"{self.base_url}/api/tags", timeout=timeout)
             return response.status_code == 200
         except:
             return False 
\ No newline at end of file
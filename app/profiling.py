@@ -0,0 +1,170 @@
+"""
+Event-loop lag monitoring and opt-in profiling.
+
+- LoopMonitor: a coroutine ticks every ``interval`` seconds and records how
+  late each tick ran (``loop.lag`` on /metrics). A watchdog thread notices
+  when the loop has not ticked for ``slow_threshold`` seconds and captures
+  the loop thread's stack while it is still blocked, tagged with the name of
+  the running task (chat turns are named ``turn-<id>``).
+- profile_cprofile / profile_sampling: time-boxed profiles of the running
+  process, returned as text.
+- Correlation IDs: ``correlation_id`` is set per WebSocket turn and prefixed
+  to ``log`` output.
+"""
+
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from .metrics import metrics
+
+correlation_id: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0").lower() in ("1", "true", "yes")
+MAX_PROFILE_SECONDS = 60
+
+
+def log(message: str):
+    """Print with the current turn's correlation ID, if any."""
+    turn = correlation_id.get()
+    if turn:
+        print(f"[turn={turn}] {message}")
+    else:
+        print(message)
+
+
+def _task_name(loop) -> Optional[str]:
+    # Read from another thread; a stale answer is fine for diagnostics
+    try:
+        task = asyncio.current_task(loop)
+    except RuntimeError:
+        return None
+    return task.get_name() if task is not None else None
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = 0.1, slow_threshold: float = 0.25, keep: int = 20):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.slow_callbacks = deque(maxlen=keep)
+        self._loop = None
+        self._loop_thread_id = None
+        self._heartbeat = time.monotonic()
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._tick(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - expected)
+            metrics.observe("loop.lag", lag)
+            metrics.set_gauge("loop.lag_ms", round(lag * 1000, 3))
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.slow_threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat
+            if blocked < self.slow_threshold or reported == heartbeat:
+                continue
+            # Report each stall once, with the stack of whatever is blocking
+            reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            task = _task_name(self._loop)
+            metrics.increment("loop.slow_callbacks")
+            self.slow_callbacks.append({
+                "detected_at": time.time(),
+                "blocked_ms": round(blocked * 1000, 1),
+                "task": task,
+                "stack": stack,
+            })
+            print(f"Event loop blocked for {blocked * 1000:.0f}ms in task {task}:\n{stack}")
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "interval_ms": self.interval * 1000,
+            "slow_threshold_ms": self.slow_threshold * 1000,
+            "lag": metrics.timings["loop.lag"].to_dict() if "loop.lag" in metrics.timings else None,
+            "slow_callbacks": list(self.slow_callbacks),
+        }
+
+
+_profile_lock = asyncio.Lock()
+
+
+async def profile_cprofile(seconds: float, limit: int = 50) -> str:
+    """Deterministic profile of the event loop thread for ``seconds``."""
+    async with _profile_lock:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(limit)
+        return output.getvalue()
+
+
+async def profile_sampling(seconds: float, interval: float = 0.005, limit: int = 50) -> str:
+    """Sample the loop thread's stack every ``interval`` seconds.
+
+    Output is in collapsed-stack format (``task;frame;frame count``) and can
+    be fed straight into flamegraph tools.
+    """
+    async with _profile_lock:
+        loop = asyncio.get_running_loop()
+        thread_id = threading.get_ident()
+        samples: Counter = Counter()
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(interval):
+                frame = sys._current_frames().get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(_task_name(loop) or "<idle>")
+                samples[";".join(reversed(stack))] += 1
+
+        sampler = threading.Thread(target=sample, name="loop-sampler", daemon=True)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            done.set()
+            await loop.run_in_executor(None, sampler.join)
+
+        return "\n".join(f"{stack} {count}" for stack, count in samples.most_common(limit))
@@ -0,0 +1,140 @@
+"""
+Prompt-prefix reuse for conversation continuation.
+
+Ollama keeps the evaluated prompt of a loaded model in its KV cache and only
+evaluates the part of a new request that differs from it, so a follow-up
+turn is cheap as long as everything before the new user message is
+byte-for-byte what was evaluated last time. The history rebuilt from the
+database can drift from that: answers are stored trimmed or cut to what
+was spoken, and rows created in the same second may come back in either
+order.
+
+A PromptCache remembers, per conversation, the exact messages of the last
+request plus the answer as Ollama generated it, and the opaque ``context``
+state where the endpoint returns one. ``stable_messages`` replaces the
+longest matching prefix of a new history with those exact messages, so the
+prompt only ever grows at the end. Entries live in an LRU and can also be
+written to ``directory`` (one JSON file per conversation) so reuse survives
+restarts and eviction.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import metrics
+from .serialization import dumps, loads
+
+_SAFE_NAME = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def _key(message: Dict[str, Any]) -> Tuple[str, str]:
+    return message.get("role"), (message.get("content") or "").strip()
+
+
+class PromptState:
+    """What Ollama evaluated for a conversation's last turn."""
+
+    __slots__ = ("model", "messages", "context")
+
+    def __init__(self, model: str, messages: List[Dict[str, str]], context: Optional[List[int]] = None):
+        self.model = model
+        self.messages = messages
+        self.context = context
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"model": self.model, "messages": self.messages, "context": self.context}
+
+
+class PromptCache:
+    def __init__(self, max_entries: int = 256, directory: str = None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self._entries: "OrderedDict[str, PromptState]" = OrderedDict()
+        self._tasks = set()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, conversation_id: str) -> str:
+        if _SAFE_NAME.fullmatch(conversation_id):
+            name = conversation_id
+        else:
+            name = hashlib.sha1(conversation_id.encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.json")
+
+    def _read(self, conversation_id: str) -> Optional[PromptState]:
+        try:
+            with open(self._path(conversation_id), "rb") as f:
+                data = loads(f.read())
+        except (OSError, ValueError):
+            return None
+        return PromptState(data["model"], data["messages"], data.get("context"))
+
+    def _write(self, conversation_id: str, state: PromptState):
+        path = self._path(conversation_id)
+        with open(path + ".tmp", "w") as f:
+            f.write(dumps(state.to_dict()))
+        os.replace(path + ".tmp", path)
+
+    def _store(self, conversation_id: str, state: PromptState):
+        self._entries[conversation_id] = state
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            metrics.increment("prompt_cache.evicted")
+
+    async def get(self, conversation_id: str) -> Optional[PromptState]:
+        state = self._entries.get(conversation_id)
+        if state is not None:
+            self._entries.move_to_end(conversation_id)
+            return state
+        if not self.directory:
+            return None
+        state = await asyncio.get_running_loop().run_in_executor(None, self._read, conversation_id)
+        if state is not None:
+            self._store(conversation_id, state)
+        return state
+
+    async def stable_messages(self, conversation_id: str, model: str,
+                              messages: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], Optional[List[int]]]:
+        """``messages`` with the already-evaluated prefix restored byte-for-byte, and the context to send."""
+        state = await self.get(conversation_id) if conversation_id else None
+        if state is None or state.model != model:
+            metrics.increment("prompt_cache.misses")
+            return messages, None
+        reused = 0
+        for cached, message in zip(state.messages, messages):
+            if _key(cached) != _key(message):
+                break
+            reused += 1
+        metrics.increment("prompt_cache.reused_messages", reused)
+        if reused < len(state.messages):
+            # The history diverged (e.g. an answer cut short); only the common part is reusable
+            metrics.increment("prompt_cache.diverged")
+            return state.messages[:reused] + messages[reused:], None
+        metrics.increment("prompt_cache.hits")
+        return state.messages + messages[reused:], state.context
+
+    def remember(self, conversation_id: str, model: str, messages: List[Dict[str, str]],
+                 reply: str, context: Optional[List[int]] = None):
+        """Record a completed turn: the request's messages plus the answer exactly as generated."""
+        if not conversation_id:
+            return
+        state = PromptState(model, [
+            {"role": message["role"], "content": message["content"]} for message in messages
+        ] + [{"role": "assistant", "content": reply}], context)
+        self._store(conversation_id, state)
+        if self.directory:
+            future = asyncio.get_running_loop().run_in_executor(None, self._write, conversation_id, state)
+            self._tasks.add(future)
+            future.add_done_callback(self._tasks.discard)
+
+
+def prompt_cache_from_env() -> Optional[PromptCache]:
+    size = int(os.getenv("OLLAMA_PROMPT_CACHE_SIZE", "256"))
+    if size <= 0:
+        return None
+    return PromptCache(size, os.getenv("OLLAMA_PROMPT_CACHE_DIR") or None)
@@ -0,0 +1,165 @@
+"""
+Model routing with named generation profiles.
+
+A GenerationProfile bundles everything sent to Ollama for one answer:
+model, sampling options, max tokens and ``keep_alive``. The ModelRouter
+picks a profile per turn, in order of precedence:
+
+1. a profile requested explicitly with the chat message,
+2. the profile a conversation is pinned to (``Conversation.profile``),
+3. the first routing rule that matches the utterance,
+4. the default profile.
+
+The built-in ``short_utterance_rule`` sends short, simple utterances to a
+small fast model (OLLAMA_FAST_MODEL); everything else escalates to the
+default model (OLLAMA_MODEL). Custom profiles can be loaded from a JSON file
+(MODEL_PROFILES_FILE)::
+
+    {"default": "quality",
+     "profiles": {"quality": {"model": "mistral", "max_tokens": 2048},
+                  "fast": {"model": "llama3.2:1b", "max_tokens": 256,
+                           "options": {"temperature": 0.5}}}}
+"""
+
+import json
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import metrics
+
+DEFAULT_OPTIONS = {"temperature": 0.7, "top_p": 0.9}
+
+# Utterances mentioning these are routed to the default model even when short
+COMPLEX_HINTS = re.compile(
+    r"\b(explain|why|how|compare|analy[sz]e|summari[sz]e|write|code|step|plan|difference|translate)\b",
+    re.IGNORECASE
+)
+
+# rule(content) -> profile name, or None to defer to the next rule
+RoutingRule = Callable[[str], Optional[str]]
+
+
+class GenerationProfile:
+    """Model and generation settings for one kind of answer."""
+
+    def __init__(self, name: str, model: str, options: Dict[str, Any] = None,
+                 max_tokens: int = 2048, keep_alive: Optional[str] = None):
+        self.name = name
+        self.model = model
+        self.options = dict(DEFAULT_OPTIONS if options is None else options)
+        self.max_tokens = max_tokens
+        self.keep_alive = keep_alive
+
+    def request_fields(self) -> Dict[str, Any]:
+        """Fields merged into an /api/chat payload."""
+        fields = {"model": self.model, "options": {**self.options, "num_predict": self.max_tokens}}
+        if self.keep_alive:
+            fields["keep_alive"] = self.keep_alive
+        return fields
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "model": self.model,
+            "options": self.options,
+            "max_tokens": self.max_tokens,
+            "keep_alive": self.keep_alive,
+        }
+
+
+def short_utterance_rule(profile: str, max_words: int = 12) -> RoutingRule:
+    """Route utterances of at most ``max_words`` words without complex hints to ``profile``."""
+    def rule(content: str) -> Optional[str]:
+        words = content.split()
+        if not words or len(words) > max_words:
+            return None
+        if COMPLEX_HINTS.search(content) or content.count("?") > 1:
+            return None
+        return profile
+    return rule
+
+
+class ModelRouter:
+    def __init__(self, profiles: Dict[str, GenerationProfile], default: str,
+                 rules: List[RoutingRule] = None):
+        if default not in profiles:
+            raise ValueError(f"Unknown default profile {default!r}")
+        self.profiles = profiles
+        self.default = default
+        self.rules = list(rules or [])
+
+    @classmethod
+    def from_env(cls) -> "ModelRouter":
+        """Build from OLLAMA_* settings, plus MODEL_PROFILES_FILE if set."""
+        keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "").strip() or None
+        options = {
+            "temperature": float(os.getenv("OLLAMA_TEMPERATURE", "0.7")),
+            "top_p": float(os.getenv("OLLAMA_TOP_P", "0.9")),
+        }
+        profiles = {
+            "quality": GenerationProfile(
+                "quality", os.getenv("OLLAMA_MODEL", "mistral"), options,
+                max_tokens=int(os.getenv("OLLAMA_MAX_TOKENS", "2048")), keep_alive=keep_alive
+            )
+        }
+        default = "quality"
+        rules = []
+
+        fast_model = os.getenv("OLLAMA_FAST_MODEL", "").strip()
+        if fast_model:
+            profiles["fast"] = GenerationProfile(
+                "fast", fast_model, options,
+                max_tokens=int(os.getenv("OLLAMA_FAST_MAX_TOKENS", "256")), keep_alive=keep_alive
+            )
+            rules.append(short_utterance_rule("fast", int(os.getenv("ROUTING_SHORT_MAX_WORDS", "12"))))
+
+        path = os.getenv("MODEL_PROFILES_FILE", "").strip()
+        if path:
+            with open(path) as f:
+                config = json.load(f)
+            for name, spec in config.get("profiles", {}).items():
+                profiles[name] = GenerationProfile(
+                    name, spec["model"], spec.get("options"),
+                    max_tokens=spec.get("max_tokens", 2048), keep_alive=spec.get("keep_alive", keep_alive)
+                )
+            default = config.get("default", default)
+        return cls(profiles, default, rules)
+
+    def add_rule(self, rule: RoutingRule):
+        self.rules.append(rule)
+
+    def route(self, content: str, pinned: str = None, requested: str = None) -> GenerationProfile:
+        """Pick the profile for one turn; ``pinned`` is the conversation's stored profile, if any.
+
+        Pins are stored on the conversation rather than in the router, so every
+        worker process sees them.
+        """
+        name = requested if requested in self.profiles else None
+        if name is None and pinned in self.profiles:
+            name = pinned
+        if name is None:
+            for rule in self.rules:
+                name = rule(content)
+                if name in self.profiles:
+                    break
+                name = None
+        profile = self.profiles[name or self.default]
+        metrics.increment(f"routing.{profile.name}")
+        return profile
+
+    def escalate(self, profile: GenerationProfile) -> Optional[GenerationProfile]:
+        """Profile to retry with when ``profile`` fails before answering, if any."""
+        if profile.name == self.default:
+            return None
+        return self.profiles[self.default]
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "default": self.default,
+            "profiles": {name: profile.to_dict() for name, profile in self.profiles.items()},
+            "rules": len(self.rules),
+            "routed": {
+                name: metrics.counters.get(f"routing.{name}", 0) for name in self.profiles
+            },
+        }
@@ -0,0 +1,159 @@
+"""
+Full-text search over message content.
+
+SQLite uses an FTS5 table keyed by the messages rowid; PostgreSQL uses a
+``message_search`` table holding a ``tsvector`` per message with a GIN
+index. The index is updated from the same write transaction that stores
+or changes a message (see ``index_messages``), so it never lags behind.
+"""
+
+import os
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import bindparam, text
+
+from .database import engine, ReadSessionLocal
+
+SEARCH_ENABLED = os.getenv("SEARCH_ENABLED", "1").lower() in ("1", "true", "yes")
+SEARCH_LANGUAGE = os.getenv("SEARCH_LANGUAGE", "english")
+MAX_PAGE_SIZE = 100
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+
+# "fts5", "postgres" or None (disabled) - set by create_search_index()
+search_backend: Optional[str] = None
+
+
+def create_search_index():
+    """Create the search index if needed and backfill it from existing messages."""
+    global search_backend
+    if not SEARCH_ENABLED:
+        return
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == "sqlite":
+                exists = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name='messages_fts'"
+                )).first()
+                if not exists:
+                    conn.execute(text(
+                        "CREATE VIRTUAL TABLE messages_fts USING fts5(content, tokenize='porter unicode61')"
+                    ))
+                    conn.execute(text(
+                        "INSERT INTO messages_fts(rowid, content) "
+                        "SELECT rowid, content FROM messages WHERE content != ''"
+                    ))
+                search_backend = "fts5"
+            elif dialect == "postgresql":
+                conn.execute(text(
+                    "CREATE TABLE IF NOT EXISTS message_search ("
+                    "message_id VARCHAR PRIMARY KEY REFERENCES messages(id) ON DELETE CASCADE, "
+                    "tsv TSVECTOR NOT NULL)"
+                ))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_message_search_tsv ON message_search USING GIN (tsv)"
+                ))
+                conn.execute(text(
+                    "INSERT INTO message_search (message_id, tsv) "
+                    "SELECT id, to_tsvector(CAST(:language AS regconfig), content) FROM messages "
+                    "WHERE content != '' ON CONFLICT (message_id) DO NOTHING"
+                ), {"language": SEARCH_LANGUAGE})
+                search_backend = "postgres"
+            else:
+                print(f"Full-text search is not supported on {dialect}")
+    except Exception as e:
+        # e.g. SQLite built without FTS5
+        print(f"Full-text search disabled: {e}")
+        search_backend = None
+
+
+def index_messages(session, message_ids: List[str]):
+    """(Re)index messages from their stored content; call inside the write transaction."""
+    if search_backend is None or not message_ids:
+        return
+    params = {"ids": list(message_ids)}
+    if search_backend == "fts5":
+        ids = _expanding("ids")
+        session.execute(text(
+            "DELETE FROM messages_fts WHERE rowid IN (SELECT rowid FROM messages WHERE id IN :ids)"
+        ).bindparams(ids), params)
+        session.execute(text(
+            "INSERT INTO messages_fts(rowid, content) "
+            "SELECT rowid, content FROM messages WHERE id IN :ids AND content != ''"
+        ).bindparams(ids), params)
+    else:
+        params["language"] = SEARCH_LANGUAGE
+        session.execute(text(
+            "INSERT INTO message_search (message_id, tsv) "
+            "SELECT id, to_tsvector(CAST(:language AS regconfig), content) FROM messages WHERE id = ANY(:ids) "
+            "ON CONFLICT (message_id) DO UPDATE SET tsv = EXCLUDED.tsv"
+        ), params)
+
+
+def search_messages(query: str, conversation_id: Optional[str] = None,
+                    limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+    """Ranked, highlighted, paginated message search."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    offset = max(0, offset)
+    result = {"query": query, "limit": limit, "offset": offset, "results": []}
+    if search_backend is None or not query.strip():
+        return result
+
+    params = {"limit": limit + 1, "offset": offset, "conversation_id": conversation_id}
+    if search_backend == "fts5":
+        params["match"] = _fts5_query(query)
+        sql = (
+            "SELECT m.id, m.conversation_id, m.role, m.created_at, "
+            f"snippet(messages_fts, 0, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 24) AS highlight, "
+            "bm25(messages_fts) AS score "
+            "FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid "
+            "WHERE messages_fts MATCH :match "
+            "AND (:conversation_id IS NULL OR m.conversation_id = :conversation_id) "
+            "ORDER BY score LIMIT :limit OFFSET :offset"
+        )
+    else:
+        params["query"] = query
+        params["language"] = SEARCH_LANGUAGE
+        params["headline_options"] = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxFragments=2"
+        sql = (
+            "SELECT m.id, m.conversation_id, m.role, m.created_at, "
+            "ts_headline(CAST(:language AS regconfig), m.content, q, :headline_options) AS highlight, "
+            "ts_rank(s.tsv, q) AS score "
+            "FROM message_search s JOIN messages m ON m.id = s.message_id, "
+            "websearch_to_tsquery(CAST(:language AS regconfig), :query) q "
+            "WHERE s.tsv @@ q "
+            "AND (CAST(:conversation_id AS VARCHAR) IS NULL OR m.conversation_id = :conversation_id) "
+            "ORDER BY score DESC LIMIT :limit OFFSET :offset"
+        )
+
+    db = ReadSessionLocal()
+    try:
+        rows = db.execute(text(sql), params).all()
+    finally:
+        db.close()
+
+    result["has_more"] = len(rows) > limit
+    result["results"] = [
+        {
+            "message_id": row.id,
+            "conversation_id": row.conversation_id,
+            "role": row.role,
+            "created_at": row.created_at,
+            "highlight": row.highlight,
+            "score": abs(row.score),
+        }
+        for row in rows[:limit]
+    ]
+    return result
+
+
+def _fts5_query(query: str) -> str:
+    """Quote each term so user input can't break FTS5 query syntax."""
+    terms = [term.replace('"', '""') for term in query.split()]
+    return " ".join(f'"{term}"' for term in terms)
+
+
+def _expanding(name: str):
+    return bindparam(name, expanding=True)
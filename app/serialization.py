@@ -0,0 +1,88 @@
+import json
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Union
+
+# orjson is optional - it is several times faster than the stdlib for the
+# small frames we send per token/audio chunk, but everything works without it.
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def dumps(obj: Any) -> str:
+    """Serialize an object to a compact JSON string."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    """Parse JSON from a str or raw bytes (no intermediate decode needed)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncGenerator[Dict[str, Any], None]:
+    """Incrementally parse newline-delimited JSON from a stream of raw bytes.
+
+    Lines are split on the byte level and handed straight to the parser, so
+    there is no per-line str decoding. Malformed lines are skipped.
+    """
+    buffer = bytearray()
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end == -1:
+                break
+            line = buffer[start:end]
+            start = end + 1
+            if line.strip():
+                try:
+                    yield loads(line)
+                except ValueError:
+                    continue
+        if start:
+            del buffer[:start]
+
+    # Trailing line without a newline terminator
+    if buffer.strip():
+        try:
+            yield loads(buffer)
+        except ValueError:
+            pass
+
+
+class FrameTemplate:
+    """Outbound frame with its constant fields serialized once.
+
+    Per-turn values such as ``type``, ``message_id`` and ``conversation_id``
+    are encoded when the template is built; ``render`` only serializes the
+    fields that change per frame and splices them onto the cached prefix.
+    """
+
+    def __init__(self, **constant: Any):
+        self._constant = frozenset(constant)
+        if constant:
+            self._prefix = dumps(constant)[:-1]
+        else:
+            self._prefix = "{"
+
+    def render(self, **fields: Any) -> str:
+        overlap = self._constant.intersection(fields)
+        if overlap:
+            raise ValueError(f"Fields already set by template: {sorted(overlap)}")
+        if not fields:
+            return self._prefix + "}" if self._prefix != "{" else "{}"
+        body = dumps(fields)
+        if self._prefix == "{":
+            return body
+        return self._prefix + "," + body[1:]
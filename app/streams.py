@@ -0,0 +1,143 @@
+"""
+Resumable turn streams.
+
+Every chat turn writes its frames through a TurnStream instead of straight
+to the WebSocket. Each frame is tagged with the turn's ``stream_id`` and a
+sequence number and kept in memory. If the socket drops mid-answer the
+turn keeps generating for ``grace_seconds`` while frames accumulate (audio
+is persisted as AudioChunk rows as usual). A client that reconnects sends
+``{"type": "resume", "stream_id": ..., "last_seq": ...}`` and gets the frames
+it missed, then the rest of the answer live. Turns nobody resumes within
+the grace period are cancelled like a stop request.
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import metrics
+
+
+class TurnStream:
+    """Frames of one chat turn, replayable after a reconnect."""
+
+    def __init__(self, stream_id: str, client_id: str, websocket, playback=None):
+        self.stream_id = stream_id
+        self.client_id = client_id
+        self.sink = websocket  # None while the client is away
+        self.playback = playback
+        self.task: Optional[asyncio.Task] = None
+        self.frames: List[Tuple[int, Optional[int], str]] = []  # (seq, chunk_index, text)
+        self.detached_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    async def send_text(self, text: str, chunk_index: int = None):
+        """Buffer a serialized frame and send it if the client is connected."""
+        seq = len(self.frames) + 1
+        # Frames are JSON objects; tag them without re-serializing
+        text = f'{{"stream_id":"{self.stream_id}","seq":{seq},{text[1:]}'
+        self.frames.append((seq, chunk_index, text))
+        sink = self.sink
+        if sink is None:
+            return
+        try:
+            await sink.send_text(text)
+        except Exception:
+            # Socket is gone; keep buffering until the client resumes
+            self.detach(sink)
+
+    def detach(self, websocket=None):
+        if websocket is not None and self.sink is not websocket:
+            return  # Already moved to a newer connection
+        if self.sink is not None:
+            self.sink = None
+            self.detached_at = time.monotonic()
+            metrics.increment("streams.detached")
+
+    def _seq_for_chunk(self, last_chunk_index: int) -> int:
+        last_seq = 0
+        for seq, chunk_index, _ in self.frames:
+            if chunk_index is not None and chunk_index <= last_chunk_index:
+                last_seq = seq
+        return last_seq
+
+    async def attach(self, websocket, last_seq: int = None, last_chunk_index: int = None) -> int:
+        """Replay frames after ``last_seq`` (or ``last_chunk_index``) and go live on ``websocket``."""
+        self.detach()
+        if last_seq is None:
+            last_seq = self._seq_for_chunk(last_chunk_index) if last_chunk_index is not None else 0
+        position = max(0, min(last_seq, len(self.frames)))  # frames[i] has seq i + 1
+        replayed = 0
+        # Frames produced while we replay are picked up by the same loop;
+        # the sink is only set once we have caught up, so nothing interleaves
+        while position < len(self.frames):
+            await websocket.send_text(self.frames[position][2])
+            position += 1
+            replayed += 1
+        self.sink = websocket
+        self.detached_at = None
+        metrics.increment("streams.resumed")
+        metrics.increment("streams.replayed_frames", replayed)
+        return replayed
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+
+
+class StreamRegistry:
+    def __init__(self, grace_seconds: float = 30.0, retain_seconds: float = 60.0):
+        self.grace_seconds = grace_seconds
+        self.retain_seconds = retain_seconds
+        self.streams: Dict[str, TurnStream] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.grace_seconds > 0
+
+    def open(self, stream_id: str, client_id: str, websocket, playback=None) -> TurnStream:
+        stream = TurnStream(stream_id, client_id, websocket, playback)
+        if self.enabled:
+            self.streams[stream_id] = stream
+        return stream
+
+    def get(self, stream_id: str) -> Optional[TurnStream]:
+        return self.streams.get(stream_id)
+
+    def detach_client(self, client_id: str, websocket) -> bool:
+        """Detach the client's streams from ``websocket``; True if a turn is still generating."""
+        running = False
+        for stream in self.streams.values():
+            if stream.client_id == client_id:
+                stream.detach(websocket)
+                running = running or not stream.finished
+        return running
+
+    def expire(self):
+        """Cancel turns abandoned past the grace period and forget old streams."""
+        now = time.monotonic()
+        for stream_id, stream in list(self.streams.items()):
+            if not stream.finished:
+                if stream.detached_at is not None and now - stream.detached_at > self.grace_seconds:
+                    if stream.task is not None:
+                        stream.task.cancel()
+                    metrics.increment("streams.abandoned")
+                    stream.finish()
+            elif now - stream.finished_at > self.retain_seconds:
+                del self.streams[stream_id]
+        metrics.set_gauge("streams.buffered", len(self.streams))
+
+    def start(self, interval: float = 1.0):
+        async def run():
+            while True:
+                await asyncio.sleep(interval)
+                self.expire()
+        self._task = asyncio.create_task(run(), name="stream-janitor")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
@@ -0,0 +1,130 @@
+"""
+Denormalized conversation summaries.
+
+Each conversation row carries ``message_count``, ``last_message_snippet``,
+``last_role`` and ``audio_bytes`` (stored base64 audio). They are updated by
+the same write transaction that adds, finishes or removes a message or its
+audio, so listing conversations is one indexed read of one table with no
+per-conversation queries or aggregates.
+
+Counters are adjusted with relative ``UPDATE ... SET x = x + n`` statements;
+only ``refresh_summaries`` (backfills and imports) recomputes them.
+"""
+
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select, text
+
+from .database import engine, add_missing_columns, SessionLocal, Conversation, Message, AudioChunk
+
+SNIPPET_LENGTH = 120
+
+SUMMARY_COLUMNS = {
+    "message_count": "INTEGER NOT NULL DEFAULT 0",
+    "last_message_snippet": "VARCHAR(120)",
+    "last_role": "VARCHAR(50)",
+    "audio_bytes": "BIGINT NOT NULL DEFAULT 0",
+}
+
+
+def snippet(content: str) -> str:
+    """Single-line preview of a message."""
+    return " ".join(content.split())[:SNIPPET_LENGTH]
+
+
+def _conversation(session, conversation_id: str):
+    return session.query(Conversation).filter(Conversation.id == conversation_id)
+
+
+def _of_message(session, message_id: str):
+    return session.query(Conversation).filter(
+        Conversation.id == select(Message.conversation_id).where(Message.id == message_id).scalar_subquery()
+    )
+
+
+def record_message(session, conversation_id: str, role: str, content: Optional[str] = None):
+    """Count a new message; ``content`` also makes it the conversation's latest."""
+    values = {Conversation.message_count: Conversation.message_count + 1}
+    if content is not None:
+        values.update({
+            Conversation.last_message_snippet: snippet(content),
+            Conversation.last_role: role,
+            Conversation.updated_at: func.now(),
+        })
+    else:
+        values[Conversation.updated_at] = Conversation.updated_at
+    _conversation(session, conversation_id).update(values, synchronize_session=False)
+
+
+def record_latest(session, conversation_id: str, role: str, content: str):
+    """Make an already counted message (e.g. a finished answer) the latest one."""
+    _conversation(session, conversation_id).update({
+        Conversation.last_message_snippet: snippet(content),
+        Conversation.last_role: role,
+        Conversation.updated_at: func.now(),
+    }, synchronize_session=False)
+
+
+def record_removed_message(session, conversation_id: str, audio_bytes: int = 0):
+    _conversation(session, conversation_id).update({
+        Conversation.message_count: Conversation.message_count - 1,
+        Conversation.audio_bytes: Conversation.audio_bytes - audio_bytes,
+        Conversation.updated_at: Conversation.updated_at,
+    }, synchronize_session=False)
+
+
+def record_audio(session, size: int, conversation_id: str = None, message_id: str = None):
+    """Add (or with a negative ``size``, remove) stored audio; keeps ``updated_at``."""
+    query = _conversation(session, conversation_id) if conversation_id else _of_message(session, message_id)
+    query.update({
+        Conversation.audio_bytes: Conversation.audio_bytes + size,
+        # Audio arriving later (lazy synthesis) must not reorder the listing
+        Conversation.updated_at: Conversation.updated_at,
+    }, synchronize_session=False)
+
+
+def refresh_summaries(session, conversation_ids: Iterable[str] = None):
+    """Recompute summaries from the messages (all conversations if no ids are given)."""
+    def latest(column):
+        return (
+            select(column)
+            .where(Message.conversation_id == Conversation.id)
+            .order_by(Message.created_at.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+
+    query = session.query(Conversation)
+    if conversation_ids is not None:
+        query = query.filter(Conversation.id.in_(list(conversation_ids)))
+    query.update({
+        Conversation.message_count: (
+            select(func.count(Message.id)).where(Message.conversation_id == Conversation.id).scalar_subquery()
+        ),
+        Conversation.last_message_snippet: latest(func.substr(Message.content, 1, SNIPPET_LENGTH)),
+        Conversation.last_role: latest(Message.role),
+        Conversation.audio_bytes: (
+            select(func.coalesce(func.sum(func.length(AudioChunk.audio_data)), 0))
+            .join(Message, Message.id == AudioChunk.message_id)
+            .where(Message.conversation_id == Conversation.id)
+            .scalar_subquery()
+        ),
+        Conversation.updated_at: Conversation.updated_at,
+    }, synchronize_session=False)
+
+
+def create_summary_columns():
+    """Add the summary columns and listing index to databases created before them."""
+    missing = add_missing_columns("conversations", SUMMARY_COLUMNS)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_conversations_updated_at ON conversations (updated_at)"
+        ))
+    if missing:
+        session = SessionLocal()
+        try:
+            refresh_summaries(session)
+            session.commit()
+        finally:
+            session.close()
+        print(f"Backfilled conversation summaries ({', '.join(missing)})")
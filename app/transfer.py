@@ -0,0 +1,266 @@
+"""
+Streaming bulk export and import of conversations as NDJSON.
+
+One record per line, parents before children so an import can insert as it
+reads:
+
+    {"type": "conversation", "id": ..., "title": ..., "created_at": ..., "updated_at": ...}
+    {"type": "message", "id": ..., "conversation_id": ..., "role": ..., "content": ..., ...}
+    {"type": "audio_chunk", "id": ..., "message_id": ..., "chunk_index": ..., "audio_data": ...}
+
+Audio is controlled by ``audio``: ``none`` (skip), ``refs`` (chunk metadata
+without the data) or ``inline`` (include base64 audio). Rows are read with
+server-side cursors and inserted in bounded batches, so memory use does not
+depend on the amount of data.
+
+Command line:
+    python -m app.transfer export backup.ndjson --audio inline
+    python -m app.transfer import backup.ndjson
+"""
+
+import argparse
+import sys
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List
+
+from sqlalchemy import insert
+
+from .database import engine, db_writer, ReadSessionLocal, Conversation, Message, AudioChunk
+from .search import create_search_index, index_messages
+from .summaries import create_summary_columns, refresh_summaries
+from .serialization import dumps, loads, iter_ndjson
+
+AUDIO_MODES = ("none", "refs", "inline")
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_BYTES = 64 * 1024
+IMPORT_BATCH_SIZE = 500
+
+MODELS = {
+    "conversation": Conversation,
+    "message": Message,
+    "audio_chunk": AudioChunk,
+}
+DATETIME_FIELDS = ("created_at", "updated_at")
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def export_records(audio: str = "none") -> Iterator[Dict[str, Any]]:
+    """Yield export records, streaming each table with a server-side cursor."""
+    if audio not in AUDIO_MODES:
+        raise ValueError(f"audio must be one of {AUDIO_MODES}")
+
+    db = ReadSessionLocal()
+    try:
+        query = (
+            db.query(Conversation.id, Conversation.title, Conversation.profile,
+                     Conversation.created_at, Conversation.updated_at)
+            .order_by(Conversation.created_at)
+            .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+        )
+        for row in query:
+            yield {
+                "type": "conversation",
+                "id": row.id,
+                "title": row.title,
+                "profile": row.profile,
+                "created_at": _iso(row.created_at),
+                "updated_at": _iso(row.updated_at),
+            }
+
+        query = (
+            db.query(Message.id, Message.conversation_id, Message.role, Message.content,
+                     Message.audio_file_path, Message.text_first, Message.created_at)
+            .order_by(Message.created_at)
+            .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+        )
+        for row in query:
+            yield {
+                "type": "message",
+                "id": row.id,
+                "conversation_id": row.conversation_id,
+                "role": row.role,
+                "content": row.content,
+                "audio_file_path": row.audio_file_path,
+                "text_first": row.text_first,
+                "created_at": _iso(row.created_at),
+            }
+
+        if audio == "none":
+            return
+        columns = [AudioChunk.id, AudioChunk.message_id, AudioChunk.chunk_index,
+                   AudioChunk.is_final, AudioChunk.created_at]
+        if audio == "inline":
+            columns.append(AudioChunk.audio_data)
+        query = (
+            db.query(*columns)
+            .order_by(AudioChunk.created_at)
+            .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+        )
+        for row in query:
+            record = {
+                "type": "audio_chunk",
+                "id": row.id,
+                "message_id": row.message_id,
+                "chunk_index": row.chunk_index,
+                "is_final": row.is_final,
+                "created_at": _iso(row.created_at),
+            }
+            if audio == "inline":
+                record["audio_data"] = row.audio_data
+            yield record
+    finally:
+        db.close()
+
+
+def export_ndjson(audio: str = "none") -> Iterator[bytes]:
+    """Export as NDJSON, grouped into ~64KB chunks for chunked transfer."""
+    buffer: List[str] = []
+    size = 0
+    for record in export_records(audio):
+        line = dumps(record) + "\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield "".join(buffer).encode("utf-8")
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def _insert_ignoring_existing(model):
+    """INSERT that skips rows whose primary key already exists (re-runnable imports)."""
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(model)
+    return dialect_insert(model).on_conflict_do_nothing()
+
+
+def _insert_batch(record_type: str, rows: List[Dict[str, Any]], session):
+    session.execute(_insert_ignoring_existing(MODELS[record_type]), rows)
+    if record_type == "message":
+        index_messages(session, [row["id"] for row in rows])
+        refresh_summaries(session, {row["conversation_id"] for row in rows})
+    elif record_type == "audio_chunk":
+        message_ids = [row["message_id"] for row in rows]
+        refresh_summaries(session, [
+            conversation_id for (conversation_id,) in
+            session.query(Message.conversation_id).filter(Message.id.in_(message_ids)).distinct()
+        ])
+
+
+class Importer:
+    """Buffers records by type and inserts them in batched transactions."""
+
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.record_type = None
+        self.rows: List[Dict[str, Any]] = []
+        self.counts = {"conversation": 0, "message": 0, "audio_chunk": 0, "skipped": 0}
+
+    def add(self, record: Dict[str, Any]):
+        """Add a record; returns a batch job to run when the buffer is full."""
+        record_type = record.pop("type", None)
+        if record_type not in MODELS or (record_type == "audio_chunk" and "audio_data" not in record):
+            # Unknown records and audio references without data can't be restored
+            self.counts["skipped"] += 1
+            return None
+
+        model = MODELS[record_type]
+        row = {key: value for key, value in record.items() if key in model.__table__.columns}
+        for field in DATETIME_FIELDS:
+            if row.get(field):
+                row[field] = datetime.fromisoformat(row[field])
+        if record_type == "message":
+            # Exports from before the column lack it; batches need the same keys in every row
+            row["text_first"] = bool(row.get("text_first"))
+
+        job = None
+        if record_type != self.record_type:
+            job = self.take()
+            self.record_type = record_type
+        self.rows.append(row)
+        if job is None and len(self.rows) >= self.batch_size:
+            job = self.take()
+        return job
+
+    def take(self):
+        """Return a job inserting the buffered rows, or None if empty."""
+        if not self.rows:
+            return None
+        record_type, rows = self.record_type, self.rows
+        self.rows = []
+        self.counts[record_type] += len(rows)
+        return lambda session: _insert_batch(record_type, rows, session)
+
+
+async def import_ndjson(chunks: AsyncIterator[bytes]) -> Dict[str, int]:
+    """Import an NDJSON byte stream, waiting for each batch before reading more."""
+    importer = Importer()
+    async for record in iter_ndjson(chunks):
+        job = importer.add(record)
+        if job is not None:
+            await db_writer.run(job)
+    job = importer.take()
+    if job is not None:
+        await db_writer.run(job)
+    return importer.counts
+
+
+def import_file(path: str) -> Dict[str, int]:
+    """Blocking import from a file (command line)."""
+    importer = Importer()
+    with open(path, "rb") as source:
+        for line in source:
+            if not line.strip():
+                continue
+            try:
+                record = loads(line)
+            except ValueError:
+                importer.counts["skipped"] += 1
+                continue
+            job = importer.add(record)
+            if job is not None:
+                db_writer.submit(job).result()
+    job = importer.take()
+    if job is not None:
+        db_writer.submit(job).result()
+    return importer.counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import conversations as NDJSON")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("path", nargs="?", help="Output file (default: stdout)")
+    export_parser.add_argument("--audio", choices=AUDIO_MODES, default="none")
+    import_parser = subparsers.add_parser("import")
+    import_parser.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        output = open(args.path, "wb") if args.path else sys.stdout.buffer
+        try:
+            for chunk in export_ndjson(args.audio):
+                output.write(chunk)
+        finally:
+            if args.path:
+                output.close()
+    else:
+        from .database import create_tables
+        create_tables()
+        create_summary_columns()
+        create_search_index()
+        print(dumps(import_file(args.path)))
+        db_writer.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Deadline-aware scheduling of TTS work across sessions.
+
+Every synthesis request carries a deadline: the moment the requesting
+client's playback buffer runs dry. Jobs are served earliest-deadline-first
+by a fixed number of workers (the backend's concurrency cap), so a listener
+about to hear silence is served before another listener's fifth sentence
+that still has seconds of audio queued ahead of it. The first sentence of a
+turn is always urgent because the user is already waiting in silence.
+"""
+
+import asyncio
+import itertools
+import time
+from typing import Any, Callable, Dict, Optional
+
+from .metrics import metrics
+
+PRIORITIES = ("first", "urgent", "normal")
+
+# Starting this late after the client's buffer ran dry counts as a miss
+MISS_TOLERANCE = 0.05
+
+
+class PlaybackBuffer:
+    """Estimate of how much audio a client has queued but not yet played."""
+
+    def __init__(self):
+        self.dry_at = 0.0  # time.monotonic() when playback runs out
+
+    def remaining(self) -> float:
+        return max(0.0, self.dry_at - time.monotonic())
+
+    def add(self, seconds: float):
+        """Account for audio just sent to the client."""
+        self.dry_at = max(self.dry_at, time.monotonic()) + seconds
+
+    def report(self, seconds: float):
+        """Client-reported buffer level; more accurate than our estimate."""
+        self.dry_at = time.monotonic() + max(0.0, seconds)
+
+    def reset(self):
+        self.dry_at = 0.0
+
+
+class _Job:
+    __slots__ = ("fn", "args", "due", "priority", "future", "enqueued", "task")
+
+    def __init__(self, fn, args, due, priority, future):
+        self.fn = fn
+        self.args = args
+        self.due = due
+        self.priority = priority
+        self.future = future
+        self.enqueued = time.monotonic()
+        self.task = None
+
+
+class TTSScheduler:
+    """Earliest-deadline-first queue in front of one TTS backend."""
+
+    def __init__(self, name: str = "edge-tts", concurrency: int = 4,
+                 urgent_threshold: float = 1.0, first_sentence_boost: float = 0.5):
+        self.name = name
+        self.concurrency = concurrency
+        self.urgent_threshold = urgent_threshold
+        self.first_sentence_boost = first_sentence_boost
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers = []
+        self._sequence = itertools.count()
+        self._depth: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self._running = 0
+
+    def deadline_for(self, buffered_seconds: float, first_sentence: bool):
+        """Return (deadline, priority) for a job given the client's buffer level."""
+        now = time.monotonic()
+        if first_sentence:
+            return now - self.first_sentence_boost, "first"
+        priority = "urgent" if buffered_seconds < self.urgent_threshold else "normal"
+        return now + buffered_seconds, priority
+
+    async def submit(self, fn: Callable[..., Any], *args, buffered_seconds: float = 0.0,
+                     first_sentence: bool = False) -> Any:
+        """Run ``fn(*args)`` when a worker is free and this job is the most urgent."""
+        self._ensure_workers()
+        deadline, priority = self.deadline_for(buffered_seconds, first_sentence)
+        due = time.monotonic() + buffered_seconds if not first_sentence else time.monotonic()
+        job = _Job(fn, args, due, priority, asyncio.get_running_loop().create_future())
+        self._queue.put_nowait((deadline, next(self._sequence), job))
+        self._set_depth(priority, 1)
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            # Abandon the job whether it is still queued or already running
+            if job.task is not None:
+                job.task.cancel()
+            job.future.cancel()
+            raise
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker(), name=f"tts-worker-{self.name}-{i}")
+                for i in range(self.concurrency)
+            ]
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            self._set_depth(job.priority, -1)
+            if job.future.done():
+                continue  # Caller went away while queued
+
+            started = time.monotonic()
+            metrics.observe(f"tts.wait.{job.priority}", started - job.enqueued)
+            if started > job.due + MISS_TOLERANCE:
+                metrics.increment(f"tts.deadline_missed.{job.priority}")
+
+            self._running += 1
+            job.task = asyncio.create_task(job.fn(*job.args))
+            try:
+                await asyncio.wait({job.task})
+            except asyncio.CancelledError:
+                job.task.cancel()
+                raise
+            finally:
+                self._running -= 1
+            metrics.observe("tts.synthesis", time.monotonic() - started)
+
+            if job.future.done():
+                continue
+            if job.task.cancelled():
+                job.future.cancel()
+            elif job.task.exception() is not None:
+                job.future.set_exception(job.task.exception())
+            else:
+                job.future.set_result(job.task.result())
+
+    def _set_depth(self, priority: str, delta: int):
+        self._depth[priority] += delta
+        metrics.set_gauge(f"tts.queue.{priority}", self._depth[priority])
+
+    def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "concurrency": self.concurrency,
+            "running": self._running,
+            "queued": dict(self._depth),
+            "wait": {
+                priority: metrics.timings[f"tts.wait.{priority}"].to_dict()
+                for priority in PRIORITIES if f"tts.wait.{priority}" in metrics.timings
+            },
+            "deadline_missed": {
+                priority: metrics.counters.get(f"tts.deadline_missed.{priority}", 0)
+                for priority in PRIORITIES
+            },
+        }
@@ -1,14 +1,29 @@
 import asyncio
-import edge_tts
 import base64
-import io
-from pydub import AudioSegment
 import re
-from typing import AsyncGenerator, List
+from typing import AsyncGenerator, List, Tuple
+
+from .audio_processing import AudioPostProcessor, MP3FrameAggregator, audio_duration
+from .health import CircuitBreaker
+
+_UNSET = object()
 
 class TTSService:
-    def __init__(self, voice="en-US-JennyNeural"):
+    def __init__(self, voice="en-US-JennyNeural", scheduler=None, breaker: CircuitBreaker = None,
+                 streaming: bool = False, stream_min_seconds: float = 0.2):
         self.voice = voice
+        self.scheduler = scheduler  # Optional TTSScheduler shared across sessions
+        # Forward audio as the backend produces it instead of per whole sentence
+        self.streaming = streaming
+        self.stream_min_seconds = stream_min_seconds
+        self.breaker = breaker or CircuitBreaker("tts")
+        self._postprocessor = _UNSET  # Built on first synthesis (imports NumPy)
+    
+    @property
+    def postprocessor(self):
+        if self._postprocessor is _UNSET:
+            self._postprocessor = AudioPostProcessor.from_env()
+        return self._postprocessor
     
     def split_into_sentences(self, text: str) -> List[str]:
         """Split text into sentences based on punctuation for streaming."""
@@ -16,45 +31,227 @@ class TTSService:
         sentences = re.split(r'(?<=[.!?])\s+', text.strip())
         return [s.strip() for s in sentences if s.strip()]
     
-    async def text_to_speech_chunk(self, text: str) -> str:
+    async def text_to_speech_chunk(self, text: str, voice: str = None) -> str:
         """Convert a single text chunk to audio and return as base64."""
+        # While the TTS backend is down, skip straight to text-only replies
+        if not self.breaker.allow():
+            return ""
         try:
+            # Imported lazily: edge_tts pulls in aiohttp and friends, which
+            # would otherwise dominate worker cold start
+            import edge_tts
+            
             # Create communicate object for this chunk
-            communicate = edge_tts.Communicate(text, self.voice)
+            communicate = edge_tts.Communicate(text, voice or self.voice)
             
             # Get audio data
-            audio_data = b""
-            async for chunk in communicate.stream():
-                if chunk["type"] == "audio":
-                    audio_data += chunk["data"]
+            parts = []
+            stream = communicate.stream()
+            try:
+                async for chunk in stream:
+                    if chunk["type"] == "audio":
+                        parts.append(chunk["data"])
+            finally:
+                # Close the TTS connection right away if we are cancelled
+                await stream.aclose()
+            audio_data = b"".join(parts)
+            if not audio_data:
+                raise RuntimeError("no audio received")
+            self.breaker.record_success()
+            
+            # Trim silence, even out loudness and fade edges off the event loop
+            if audio_data and self.postprocessor is not None:
+                loop = asyncio.get_running_loop()
+                audio_data = await loop.run_in_executor(None, self.postprocessor.process, audio_data)
             
             # Convert to base64
             audio_base64 = base64.b64encode(audio_data).decode('utf-8')
             return audio_base64
             
+        except asyncio.CancelledError:
+            # Barge-in: no verdict, so let the next call be the trial
+            self.breaker.release()
+            raise
         except Exception as e:
+            self.breaker.record_failure()
             print(f"Error in TTS conversion: {e}")
             return ""
     
-    async def stream_text_to_speech(self, text: str) -> AsyncGenerator[dict, None]:
-        """Stream text to speech by processing sentence by sentence."""
+    async def stream_sentence_audio(self, text: str, voice: str = None) -> AsyncGenerator[Tuple[bytes, float, bytes], None]:
+        """Yield ``(mp3_bytes, seconds, lead_in)`` pieces of one sentence while it is being synthesized.
+        
+        Pieces are whole MP3 frames of at least ``stream_min_seconds``;
+        ``lead_in`` holds the earlier frames a piece needs to decode on its
+        own (see MP3FrameAggregator). Post-processing needs the whole sentence
+        and is skipped here.
+        """
+        if not self.breaker.allow():
+            return
+        import edge_tts
+        
+        aggregator = MP3FrameAggregator(self.stream_min_seconds)
+        stream = edge_tts.Communicate(text, voice or self.voice).stream()
+        received = False
+        try:
+            async for chunk in stream:
+                if chunk["type"] == "audio":
+                    for piece in aggregator.feed(chunk["data"]):
+                        received = True
+                        yield piece
+            tail = aggregator.flush()
+            if tail[0]:
+                received = True
+                yield tail
+            if not received:
+                raise RuntimeError("no audio received")
+            self.breaker.record_success()
+        except (asyncio.CancelledError, GeneratorExit):
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self.breaker.record_failure()
+            print(f"Error in streaming TTS conversion: {e}")
+        finally:
+            await stream.aclose()
+    
+    async def _scheduled_sentence_stream(self, text: str, voice: str, buffered_seconds: float,
+                                         first_sentence: bool) -> AsyncGenerator[Tuple[bytes, float, bytes], None]:
+        """``stream_sentence_audio`` run inside a TTSScheduler slot, pieces handed over via a queue."""
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        async def pump():
+            try:
+                async for piece in self.stream_sentence_audio(text, voice):
+                    queue.put_nowait(piece)
+            finally:
+                queue.put_nowait(None)
+        
+        job = asyncio.ensure_future(self.scheduler.submit(
+            pump, buffered_seconds=buffered_seconds, first_sentence=first_sentence
+        ))
+        getter = None
+        try:
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait({getter, job}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    # Job ended (or failed before starting); drain what it left behind
+                    getter.cancel()
+                    job.result()
+                    while not queue.empty():
+                        piece = queue.get_nowait()
+                        if piece is None:
+                            return
+                        yield piece
+                    return
+                piece = getter.result()
+                if piece is None:
+                    return
+                yield piece
+        finally:
+            # Stops a synthesis that is still queued or running, and a get()
+            # left waiting on the queue if we were cancelled in asyncio.wait
+            job.cancel()
+            if getter is not None:
+                getter.cancel()
+    
+    async def health_check(self) -> bool:
+        """Check that the edge-tts service answers (lists voices)."""
+        import edge_tts
+        return bool(await edge_tts.list_voices())
+    
+    async def stream_text_to_speech(self, text: str, voice: str = None, playback=None,
+                                    first_of_turn: bool = False) -> AsyncGenerator[dict, None]:
+        """Stream text to speech by processing sentence by sentence.
+        
+        With a scheduler, each sentence is queued by how soon the client's
+        ``playback`` buffer runs dry; the first sentence of a turn goes first.
+        
+        In streaming mode each sentence arrives as several ``partial`` items
+        followed by one ``sentence_end`` item (no ``audio_data``) carrying the
+        whole sentence's audio in ``sentence_audio`` for persistence. A
+        partial item's ``audio_data`` starts with ``lead_in`` bytes of earlier
+        frames; the player keeps only its last ``duration`` seconds.
+        
+        A sentence that could not be synthesized (e.g. the TTS circuit is
+        open) still yields one item, with ``audio_data`` None, so its text
+        reaches the client.
+        """
         sentences = self.split_into_sentences(text)
         
         for i, sentence in enumerate(sentences):
-            if sentence.strip():
+            if sentence.strip() and self.streaming:
+                buffered = playback.remaining() if playback is not None else 0.0
+                first_sentence = first_of_turn and i == 0
+                if self.scheduler is not None:
+                    pieces = self._scheduled_sentence_stream(sentence, voice, buffered, first_sentence)
+                else:
+                    pieces = self.stream_sentence_audio(sentence, voice)
+                parts = []
+                seconds = 0.0
+                try:
+                    async for audio, duration, lead_in in pieces:
+                        yield {
+                            "chunk_index": i,
+                            "part_index": len(parts),
+                            "text": sentence,
+                            "audio_data": base64.b64encode(lead_in + audio).decode("utf-8"),
+                            "lead_in": len(lead_in),
+                            "duration": duration,
+                            "is_final": False,
+                            "partial": True
+                        }
+                        parts.append(audio)
+                        seconds += duration
+                finally:
+                    await pieces.aclose()
+                if parts:
+                    yield {
+                        "chunk_index": i,
+                        "text": sentence,
+                        "audio_data": None,
+                        "sentence_audio": base64.b64encode(b"".join(parts)).decode("utf-8"),
+                        "duration": seconds,
+                        "is_final": i == len(sentences) - 1,
+                        "sentence_end": True
+                    }
+                else:
+                    yield self._text_only(sentence, i, len(sentences))
+            elif sentence.strip():
                 # Convert sentence to audio
-                audio_base64 = await self.text_to_speech_chunk(sentence)
+                if self.scheduler is not None:
+                    audio_base64 = await self.scheduler.submit(
+                        self.text_to_speech_chunk, sentence, voice,
+                        buffered_seconds=playback.remaining() if playback is not None else 0.0,
+                        first_sentence=first_of_turn and i == 0
+                    )
+                else:
+                    audio_base64 = await self.text_to_speech_chunk(sentence, voice)
                 
                 if audio_base64:
                     yield {
                         "chunk_index": i,
                         "text": sentence,
                         "audio_data": audio_base64,
+                        "duration": audio_duration(base64.b64decode(audio_base64)),
                         "is_final": i == len(sentences) - 1
                     }
-                
-                # Small delay to prevent overwhelming the client
-                await asyncio.sleep(0.1)
+                    
+                    # Small delay to prevent overwhelming the client
+                    await asyncio.sleep(0.1)
+                else:
+                    yield self._text_only(sentence, i, len(sentences))
+    
+    @staticmethod
+    def _text_only(sentence: str, index: int, count: int) -> dict:
+        """Item for a sentence without audio, so the reply is still shown."""
+        return {
+            "chunk_index": index,
+            "text": sentence,
+            "audio_data": None,
+            "duration": 0.0,
+            "is_final": index == count - 1
+        }
     
     def get_available_voices(self):
         """Get list of available voices."""
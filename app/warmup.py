@@ -0,0 +1,137 @@
+"""
+Model warm-up and keep-alive management.
+
+On startup every model used by a generation profile is loaded into Ollama
+and one throwaway sentence is synthesized per configured voice, so the first
+real turn after a deploy does not pay model load or TTS cold-start time.
+
+Ollama unloads a model once its ``keep_alive`` expires. While a model has
+seen chat traffic within ``traffic_window`` seconds, the warmer re-sends
+``keep_alive`` whenever the model has been idle for ``refresh_interval``
+seconds, so quiet periods in an active deployment don't unload it. The
+default model is kept loaded regardless of traffic when ``pin_default`` is
+set. Models nobody uses are left to expire.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from .metrics import metrics
+from .routing import ModelRouter
+
+
+class ModelWarmer:
+    def __init__(self, ollama_service, router: ModelRouter, tts_service=None, voices: List[str] = None,
+                 refresh_interval: float = 240.0, traffic_window: float = 1800.0,
+                 keep_alive: str = "10m", pin_default: bool = True):
+        self.ollama = ollama_service
+        self.router = router
+        self.tts = tts_service
+        self.voices = list(voices or [])
+        self.refresh_interval = refresh_interval
+        self.traffic_window = traffic_window
+        self.keep_alive = keep_alive
+        self.pin_default = pin_default
+        self.state = "pending"  # pending -> warming -> done
+        self.models: Dict[str, Dict[str, Any]] = {}
+        self.tts_voices: Dict[str, Dict[str, Any]] = {}
+        self._last_contact: Dict[str, float] = {}  # model -> last warm-up or refresh
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.state == "done"
+
+    def _keep_alive_for(self, model: str) -> str:
+        for profile in self.router.profiles.values():
+            if profile.model == model and profile.keep_alive:
+                return profile.keep_alive
+        return self.keep_alive
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="model-warmer")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        await self.warm_up()
+        while True:
+            await asyncio.sleep(self.refresh_interval / 4)
+            await self.refresh()
+
+    async def warm_up(self):
+        """Load all profile models and prime TTS once per voice."""
+        self.state = "warming"
+        started = time.monotonic()
+        models = {profile.model for profile in self.router.profiles.values()}
+        await asyncio.gather(*(self._load(model, "warmup") for model in models))
+        # One voice at a time: these go straight to the TTS backend, outside the scheduler
+        if self.tts is not None:
+            for voice in self.voices:
+                await self._warm_voice(voice)
+        self.state = "done"
+        metrics.observe("warmup.total", time.monotonic() - started)
+        print(f"Warm-up finished in {time.monotonic() - started:.2f}s: "
+              f"{sum(m['ok'] for m in self.models.values())}/{len(self.models)} model(s) loaded")
+
+    async def _load(self, model: str, reason: str):
+        entry = self.models.setdefault(model, {"ok": None, "load_seconds": None, "warmed_at": None,
+                                               "refreshed_at": None, "refreshes": 0, "error": None})
+        try:
+            seconds = await self.ollama.load_model(model, self._keep_alive_for(model))
+        except Exception as e:
+            entry.update(ok=False, error=str(e))
+            metrics.increment(f"warmup.failed.{model}")
+            print(f"Could not load model {model}: {e}")
+            return
+        self._last_contact[model] = time.monotonic()
+        entry.update(ok=True, error=None)
+        if reason == "warmup":
+            entry.update(load_seconds=round(seconds, 3), warmed_at=time.time())
+            metrics.observe(f"warmup.model.{model}", seconds)
+        else:
+            entry["refreshed_at"] = time.time()
+            entry["refreshes"] += 1
+            metrics.increment("warmup.refreshes")
+
+    async def _warm_voice(self, voice: str):
+        started = time.monotonic()
+        audio = await self.tts.text_to_speech_chunk("Hello.", voice)
+        seconds = time.monotonic() - started
+        self.tts_voices[voice] = {"ok": bool(audio), "seconds": round(seconds, 3), "warmed_at": time.time()}
+        metrics.observe(f"warmup.tts.{voice}", seconds)
+
+    async def refresh(self):
+        """Re-send keep_alive for models with recent traffic that are about to idle out."""
+        if not self.ollama.breaker.available():
+            return
+        now = time.monotonic()
+        default_model = self.router.profiles[self.router.default].model
+        due = []
+        for model in self.models:
+            last_used = self.ollama.last_used.get(model)
+            recent = last_used is not None and now - last_used < self.traffic_window
+            if not recent and not (self.pin_default and model == default_model):
+                continue
+            last_contact = max(last_used or 0.0, self._last_contact.get(model, 0.0))
+            if now - last_contact >= self.refresh_interval:
+                due.append(model)
+        await asyncio.gather(*(self._load(model, "refresh") for model in due))
+
+    def report(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "state": self.state,
+            "models": {
+                model: {
+                    **entry,
+                    "idle_seconds": round(now - self.ollama.last_used[model], 1)
+                    if model in self.ollama.last_used else None,
+                }
+                for model, entry in self.models.items()
+            },
+            "tts": dict(self.tts_voices),
+        }
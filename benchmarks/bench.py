@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the per-token and per-chunk hot paths.
+
+    python benchmarks/bench.py                 # run and compare with baseline.json
+    python benchmarks/bench.py -k frames       # only benchmarks whose name contains "frames"
+    python benchmarks/bench.py --update        # store the results as the new baseline
+    python benchmarks/bench.py --record "Tell me about tides" --name tides
+
+Inputs are fixed. Ollama streams are replayed from the NDJSON files in
+benchmarks/fixtures (raw /api/chat output, recorded with --record) through
+an in-process HTTP transport, one line per network read; audio comes from
+fixtures/sentence.mp3. Each benchmark reports the median time per
+operation over several rounds.
+
+Each round is divided by a short pure-Python calibration run made just
+before it, so a baseline recorded on one machine remains usable on a
+faster or slower one. A benchmark more than --threshold slower than its
+baseline fails the run (exit code 1).
+
+AudioChunk inserts run against a throwaway SQLite file, and against
+PostgreSQL when BENCH_POSTGRES_URL is set (tables are created there, so
+point it at a scratch database).
+"""
+
+import argparse
+import asyncio
+import base64
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT, "benchmarks", "fixtures")
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+sys.path.insert(0, ROOT)
+
+import httpx
+
+from app.audio_processing import MP3FrameAggregator, audio_duration
+from app.ollama_service import OllamaService
+from app.serialization import FrameTemplate, JSON_BACKEND, loads
+from app.streams import TurnStream
+from app.tts_service import TTSService
+
+# name -> (unit, factory); a factory returns (run, operations per run), or None to skip
+BENCHMARKS = {}
+
+
+def benchmark(name, unit):
+    def register(factory):
+        BENCHMARKS[name] = (unit, factory)
+        return factory
+    return register
+
+
+class Fixture:
+    """A recorded /api/chat stream."""
+
+    def __init__(self, path):
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, "rb") as f:
+            self.lines = [line for line in f.read().splitlines(keepends=True) if line.strip()]
+        self.tokens = [
+            frame["message"]["content"]
+            for frame in map(loads, self.lines) if frame.get("message", {}).get("content")
+        ]
+
+
+def load_fixtures():
+    return [Fixture(path) for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.ndjson")))]
+
+
+def load_audio():
+    with open(os.path.join(FIXTURES_DIR, "sentence.mp3"), "rb") as f:
+        return f.read()
+
+
+FIXTURES = load_fixtures()
+AUDIO = load_audio()
+AUDIO_BASE64 = base64.b64encode(AUDIO).decode("utf-8")
+
+
+def replay_service(fixture):
+    """OllamaService whose /api/chat replays ``fixture`` one NDJSON line per read."""
+    async def lines():
+        for line in fixture.lines:
+            yield line
+
+    def handler(request):
+        return httpx.Response(200, content=lines())
+
+    service = OllamaService(base_url="http://ollama.bench")
+    service.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return service
+
+
+# What stream_chat would send; _stream_once reads the model and messages back
+REPLAY_PAYLOAD = {"model": "bench", "messages": []}
+
+
+def segment(fixture):
+    """The chunks OllamaService emits for ``fixture``."""
+    service = replay_service(fixture)
+
+    async def collect():
+        return [chunk["content"] async for chunk in service._stream_once(REPLAY_PAYLOAD, "bench")]
+    return asyncio.run(collect())
+
+
+@benchmark("segmentation.is_complete_chunk", "token")
+def bench_is_complete_chunk():
+    is_complete_chunk = OllamaService._is_complete_chunk
+    tokens = [token for fixture in FIXTURES for token in fixture.tokens]
+
+    def run():
+        current = ""
+        for token in tokens:
+            current += token
+            if is_complete_chunk(None, current):
+                current = ""
+    return run, len(tokens)
+
+
+@benchmark("segmentation.stream", "token")
+def bench_stream():
+    """NDJSON parsing, token deadlines and chunking for whole replayed answers."""
+    services = [replay_service(fixture) for fixture in FIXTURES]
+    loop = asyncio.new_event_loop()
+
+    async def consume():
+        for service in services:
+            async for _ in service._stream_once(REPLAY_PAYLOAD, "bench"):
+                pass
+
+    def run():
+        loop.run_until_complete(consume())
+    return run, sum(len(fixture.lines) for fixture in FIXTURES)
+
+
+@benchmark("sentences.split", "chunk")
+def bench_split_into_sentences():
+    tts = TTSService()
+    chunks = [chunk for fixture in FIXTURES for chunk in segment(fixture)]
+
+    def run():
+        for chunk in chunks:
+            tts.split_into_sentences(chunk)
+    return run, len(chunks)
+
+
+def _frames():
+    """(accumulated content, chunk_index, is_final) per frame of each replayed answer."""
+    frames = []
+    for fixture in FIXTURES:
+        chunks = segment(fixture)
+        content = ""
+        for index, chunk in enumerate(chunks):
+            content += chunk
+            frames.append((content, index, index == len(chunks) - 1))
+    return frames
+
+
+@benchmark("frames.render", "frame")
+def bench_frame_render():
+    frames = _frames()
+    template = FrameTemplate(
+        type="chat_response", message_id=str(uuid.UUID(int=1)),
+        conversation_id=str(uuid.UUID(int=2)), turn_id="0123456789ab"
+    )
+
+    def run():
+        for content, index, is_final in frames:
+            template.render(content=content, audio_data=AUDIO_BASE64, chunk_index=index, is_final=is_final)
+    return run, len(frames)
+
+
+@benchmark("frames.turn_stream", "frame")
+def bench_turn_stream():
+    """Render, tag with stream id/seq and buffer, as stream_response sends each frame."""
+    frames = _frames()
+    template = FrameTemplate(
+        type="chat_response", message_id=str(uuid.UUID(int=1)),
+        conversation_id=str(uuid.UUID(int=2)), turn_id="0123456789ab"
+    )
+
+    class Sink:
+        async def send_text(self, text):
+            pass
+
+    loop = asyncio.new_event_loop()
+
+    async def send_all():
+        stream = TurnStream("0123456789ab", "bench", Sink())
+        for content, index, is_final in frames:
+            await stream.send_text(template.render(
+                content=content, audio_data=AUDIO_BASE64, chunk_index=index, is_final=is_final
+            ), chunk_index=index)
+
+    def run():
+        loop.run_until_complete(send_all())
+    return run, len(frames)
+
+
+@benchmark("audio.b64encode", "sentence")
+def bench_b64encode():
+    def run():
+        for _ in range(50):
+            base64.b64encode(AUDIO).decode("utf-8")
+    return run, 50
+
+
+@benchmark("audio.b64decode", "sentence")
+def bench_b64decode():
+    def run():
+        for _ in range(50):
+            base64.b64decode(AUDIO_BASE64)
+    return run, 50
+
+
+@benchmark("audio.duration", "sentence")
+def bench_audio_duration():
+    def run():
+        for _ in range(20):
+            audio_duration(AUDIO)
+    return run, 20
+
+
+@benchmark("audio.mp3_aggregate", "sentence")
+def bench_mp3_aggregate():
+    """Regrouping streamed edge-tts bytes (400-byte reads) into whole MP3 frames."""
+    pieces = [AUDIO[i:i + 400] for i in range(0, len(AUDIO), 400)]
+
+    def run():
+        for _ in range(10):
+            aggregator = MP3FrameAggregator(0.2)
+            for piece in pieces:
+                aggregator.feed(piece)
+            aggregator.flush()
+    return run, 10
+
+
+def _insert_benchmark(url, writer_enabled, rows=200):
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+
+    from app.database import AudioChunk, Base, Conversation, Message, WriteQueue, _apply_sqlite_pragmas
+
+    sqlite = url.startswith("sqlite")
+    engine = create_engine(url, connect_args={"check_same_thread": False} if sqlite else {})
+    if sqlite:
+        event.listen(engine, "connect", _apply_sqlite_pragmas)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # Same write path as the app: batched writer thread on SQLite, inline sessions otherwise
+    writer = WriteQueue(session_factory, enabled=writer_enabled)
+
+    conversation_id, message_id = str(uuid.uuid4()), str(uuid.uuid4())
+
+    def add_parent(session):
+        session.add(Conversation(id=conversation_id, title="benchmark"))
+        session.add(Message(id=message_id, conversation_id=conversation_id, content="", role="assistant"))
+    writer.submit(add_parent).result()
+
+    def add_chunk(index, session):
+        session.add(AudioChunk(id=str(uuid.uuid4()), message_id=message_id, chunk_index=index,
+                               audio_data=AUDIO_BASE64, is_final=False))
+
+    def run():
+        futures = [writer.submit(lambda session, index=index: add_chunk(index, session)) for index in range(rows)]
+        for future in futures:
+            future.result()
+    return run, rows
+
+
+@benchmark("db.audio_chunk_insert.sqlite", "row")
+def bench_insert_sqlite():
+    directory = tempfile.mkdtemp(prefix="voicechat-bench-")
+    return _insert_benchmark(f"sqlite:///{directory}/bench.db", writer_enabled=True)
+
+
+@benchmark("db.audio_chunk_insert.postgres", "row")
+def bench_insert_postgres():
+    url = os.getenv("BENCH_POSTGRES_URL")
+    if not url:
+        return None
+    return _insert_benchmark(url, writer_enabled=False)
+
+
+def calibrate(rounds=5):
+    """Seconds for a fixed pure-Python workload (best of ``rounds``)."""
+    def work():
+        total = 0
+        text = "calibration " * 20
+        for i in range(20000):
+            total += len(text[i % 50:]) + (i * 7) % 13
+        return total
+
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        work()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def measure(run, operations, rounds, min_seconds):
+    """(best seconds per operation, median time relative to the calibration workload).
+
+    Each round repeats ``run`` for at least ``min_seconds`` right after a
+    calibration run, so machine-wide slowdowns during the run cancel out.
+    """
+    run()  # Warm-up
+    timings, relative = [], []
+    for _ in range(rounds):
+        calibration = calibrate(rounds=2)
+        repeats = 0
+        started = time.perf_counter()
+        while True:
+            run()
+            repeats += 1
+            elapsed = time.perf_counter() - started
+            if elapsed >= min_seconds:
+                break
+        timings.append(elapsed / (repeats * operations))
+        relative.append(timings[-1] / calibration)
+    return min(timings), statistics.median(relative)
+
+
+def record_fixture(prompt, name):
+    """Save Ollama's raw /api/chat stream for ``prompt`` as a fixture."""
+    base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    payload = {
+        "model": os.getenv("OLLAMA_MODEL", "mistral"),
+        "messages": [{"role": "user", "content": prompt}],
+        "stream": True
+    }
+    path = os.path.join(FIXTURES_DIR, f"{name}.ndjson")
+    with httpx.stream("POST", f"{base_url}/api/chat", json=payload, timeout=None) as response:
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            for line in response.iter_lines():
+                if line.strip():
+                    f.write(line.encode("utf-8") + b"\n")
+    print(f"Recorded {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-path microbenchmarks")
+    parser.add_argument("-k", dest="filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--rounds", type=int, default=9)
+    parser.add_argument("--min-time", type=float, default=0.05, help="minimum seconds per round")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="allowed slowdown vs. baseline (default: the baseline's, else 0.25)")
+    parser.add_argument("--update", action="store_true", help="write the results to baseline.json")
+    parser.add_argument("--record", metavar="PROMPT", help="record a new fixture from Ollama and exit")
+    parser.add_argument("--name", default="recorded", help="fixture name for --record")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixture(args.record, args.name)
+        return 0
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+    threshold = args.threshold if args.threshold is not None else baseline.get("threshold", 0.25)
+
+    calibration = calibrate()
+    print(f"Python {platform.python_version()}, JSON backend {JSON_BACKEND}, "
+          f"fixtures: {', '.join(fixture.name for fixture in FIXTURES)}, calibration {calibration * 1000:.2f} ms")
+    print(f"{'benchmark':<34} {'µs/op':>10} {'baseline':>10} {'change':>8}")
+
+    results = {}
+    regressions = []
+    for name, (unit, factory) in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        prepared = factory()
+        if prepared is None:
+            print(f"{name:<34} {'skipped':>10}")
+            continue
+        run, operations = prepared
+        seconds, relative = measure(run, operations, args.rounds, args.min_time)
+        results[name] = {"unit": unit, "seconds_per_op": seconds, "relative": relative}
+
+        reference = baseline.get("results", {}).get(name)
+        if reference is None:
+            print(f"{name:<34} {seconds * 1e6:>10.2f} {'-':>10} {'new':>8}  per {unit}")
+            continue
+        change = relative / reference["relative"] - 1
+        expected = seconds / (1 + change)  # Baseline scaled to this machine
+        status = ""
+        if change > threshold:
+            regressions.append(name)
+            status = "  REGRESSION"
+        print(f"{name:<34} {seconds * 1e6:>10.2f} {expected * 1e6:>10.2f} {change:>+8.1%}  per {unit}{status}")
+
+    if args.update:
+        merged = dict(baseline.get("results", {}))
+        merged.update(results)
+        with open(BASELINE_PATH, "w") as f:
+            json.dump({
+                "threshold": threshold,
+                "calibration_seconds": calibration,
+                "python": platform.python_version(),
+                "json_backend": JSON_BACKEND,
+                "results": merged
+            }, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {BASELINE_PATH}")
+        return 0
+
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
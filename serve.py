@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Production entry point for Voice Chat with Ollama Mistral
+
+Unlike run.py (single process with auto-reload), this starts multiple
+worker processes with a selectable event loop and HTTP parser.
+
+Environment variables (config.env):
+    HOST, PORT        Bind address
+    WORKERS           Number of worker processes (default: CPU count)
+    LOOP              auto | uvloop | asyncio (default: auto)
+    HTTP              auto | httptools | h11 (default: auto)
+    PRELOAD           1 to import the app once in the master before forking
+                      (requires gunicorn; ignored otherwise)
+    LOG_LEVEL         Uvicorn log level (default: info)
+
+On SIGTERM/SIGINT each worker drains (see ConnectionManager.drain in
+app/main.py) while its WebSockets are still open, and only then lets
+uvicorn shut down, which closes every connection. A second signal skips
+the rest of the drain.
+"""
+
+import asyncio
+import os
+import sys
+import time
+import multiprocessing
+
+import uvicorn
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv("config.env")
+
+APP_PATH = "app.main:app"
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn server that drains the app before its own shutdown starts."""
+
+    draining = False
+
+    def handle_exit(self, sig, frame):
+        if self.started and not self.draining and not self.should_exit:
+            self.draining = True
+            # May run as a plain signal handler (Windows), so hop onto the loop
+            asyncio.get_event_loop().call_soon_threadsafe(self._start_drain)
+            return
+        super().handle_exit(sig, frame)
+
+    def _start_drain(self):
+        self._drain_task = asyncio.ensure_future(self._drain_then_exit())
+
+    async def _drain_then_exit(self):
+        try:
+            from app.main import manager
+            await manager.drain()
+        except Exception as e:
+            print(f"Drain failed: {e}")
+        finally:
+            self.should_exit = True
+
+
+def get_settings():
+    """Read launcher settings from the environment."""
+    return {
+        "host": os.getenv("HOST", "0.0.0.0"),
+        "port": int(os.getenv("PORT", 8000)),
+        "workers": int(os.getenv("WORKERS", multiprocessing.cpu_count())),
+        "loop": os.getenv("LOOP", "auto"),
+        "http": os.getenv("HTTP", "auto"),
+        "preload": os.getenv("PRELOAD", "0").lower() in ("1", "true", "yes"),
+        "log_level": os.getenv("LOG_LEVEL", "info"),
+    }
+
+
+def run_gunicorn(settings):
+    """Run under gunicorn with uvicorn workers so the app can be preloaded."""
+    from gunicorn.app.base import BaseApplication
+    from uvicorn.workers import UvicornWorker
+
+    class Worker(UvicornWorker):
+        CONFIG_KWARGS = {"loop": settings["loop"], "http": settings["http"]}
+
+        async def _serve(self):
+            # UvicornWorker._serve with DrainingServer in place of uvicorn.Server
+            from gunicorn.arbiter import Arbiter
+            self.config.app = self.wsgi
+            server = DrainingServer(config=self.config)
+            self._install_sigquit_handler()
+            await server.serve(sockets=self.sockets)
+            if not server.started:
+                sys.exit(Arbiter.WORKER_BOOT_ERROR)
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{settings['host']}:{settings['port']}")
+            self.cfg.set("workers", settings["workers"])
+            self.cfg.set("worker_class", Worker)
+            self.cfg.set("preload_app", True)
+            self.cfg.set("loglevel", settings["log_level"])
+
+        def load(self):
+            from app.main import app
+            return app
+
+    Application().run()
+
+
+def run_uvicorn(settings):
+    """Run with uvicorn's own process manager (what uvicorn.run does, with DrainingServer)."""
+    from uvicorn.supervisors import Multiprocess
+
+    config = uvicorn.Config(
+        APP_PATH,
+        host=settings["host"],
+        port=settings["port"],
+        workers=settings["workers"],
+        loop=settings["loop"],
+        http=settings["http"],
+        log_level=settings["log_level"],
+    )
+    server = DrainingServer(config=config)
+    if config.workers > 1:
+        sock = config.bind_socket()
+        Multiprocess(config, target=server.run, sockets=[sock]).run()
+    else:
+        server.run()
+    if not server.started and config.workers == 1:
+        sys.exit(3)
+
+
+if __name__ == "__main__":
+    settings = get_settings()
+    started = time.perf_counter()
+
+    print("🚀 Starting Voice Chat with Ollama Mistral (production)...")
+    print(f"📡 Listening on http://{settings['host']}:{settings['port']}")
+    print(f"⚙️  Workers: {settings['workers']}, loop: {settings['loop']}, http: {settings['http']}")
+
+    if settings["preload"]:
+        try:
+            import gunicorn  # noqa: F401
+        except ImportError:
+            print("⚠️  PRELOAD requested but gunicorn is not installed; starting without preload")
+            settings["preload"] = False
+
+    if settings["preload"]:
+        print(f"📦 Preloading app (launcher ready in {time.perf_counter() - started:.3f}s)")
+        run_gunicorn(settings)
+    else:
+        run_uvicorn(settings)
@@ -0,0 +1,99 @@
+import io
+import os
+
+import numpy as np
+import pytest
+
+sf = pytest.importorskip("soundfile")
+
+from app.audio_processing import AudioPostProcessor, MP3FrameAggregator
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "fixtures", "sentence.mp3")
+
+
+def _read(data, first, block):
+    # libsndfile stops at a length estimated from the first frame's bitrate;
+    # trailing zeros lift that limit but end the stream with a resync error,
+    # which drops the whole read that runs into it
+    blocks = []
+    with sf.SoundFile(io.BytesIO(data + bytes(8 * len(data)))) as f:
+        try:
+            if first:
+                blocks.append(f.read(first, dtype="float32"))
+            while True:
+                samples = f.read(block, dtype="float32")
+                if not len(samples):
+                    break
+                blocks.append(samples)
+        except sf.LibsndfileError:
+            pass
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype="float32")
+
+
+def decode(data):
+    """Decode an MP3 byte string on its own, like the client's ``decodeAudioData``."""
+    whole_frames = len(_read(data, 0, 576))
+    return _read(data, whole_frames, 1)
+
+
+@pytest.fixture(scope="module")
+def sentence():
+    with open(FIXTURE, "rb") as f:
+        return f.read()
+
+
+def stream_pieces(data, min_seconds=0.2, chunk_size=1000):
+    aggregator = MP3FrameAggregator(min_seconds)
+    pieces = []
+    for offset in range(0, len(data), chunk_size):
+        pieces += aggregator.feed(data[offset:offset + chunk_size])
+    tail = aggregator.flush()
+    if tail[0]:
+        pieces.append(tail)
+    return pieces
+
+
+def test_pieces_are_the_stream(sentence):
+    pieces = stream_pieces(sentence)
+    assert len(pieces) > 2
+    assert b"".join(piece for piece, _, _ in pieces) == sentence
+    assert pieces[0][2] == b""
+    assert all(lead_in for _, _, lead_in in pieces[1:])
+
+
+@pytest.mark.parametrize("min_seconds", [0.05, 0.2, 0.5])
+def test_each_piece_decodes_without_gaps(sentence, min_seconds):
+    whole = decode(sentence)
+    sample_rate = sf.info(io.BytesIO(sentence)).samplerate
+    decoded = []
+    for piece, seconds, lead_in in stream_pieces(sentence, min_seconds):
+        samples = decode(lead_in + piece)
+        if lead_in:
+            expected = round(seconds * sample_rate)
+            assert len(samples) >= expected
+            samples = samples[-expected:]
+        decoded.append(samples)
+    joined = np.concatenate(decoded)
+    # Only the encoder padding at the very end (trimmed via the Xing tag) is extra
+    assert len(whole) <= len(joined) < len(whole) + 576
+    assert np.abs(joined[:len(whole)] - whole).max() < 1e-3
+
+
+@pytest.fixture
+def processor():
+    return AudioPostProcessor()
+
+
+def test_processed_audio_is_smaller(processor, sentence):
+    processed = processor.process(sentence)
+    assert len(processed) < len(sentence)
+    assert sf.info(io.BytesIO(processed)).samplerate == sf.info(io.BytesIO(sentence)).samplerate
+
+
+def test_encoder_without_bitrate_control_falls_back(processor, sentence):
+    # soundfile without encoder options and without the private libsndfile bindings
+    processor._encoder_options = False
+    processor._sf_command = None
+    processed = processor.process(sentence)
+    assert processed and processed != sentence
+    assert len(decode(processed)) > 0
@@ -0,0 +1,24 @@
+import gzip
+import os
+from types import SimpleNamespace
+
+from app.maintenance import AudioMaintenance, RetentionPolicy
+
+
+def chunk(conversation_id):
+    return SimpleNamespace(
+        id="c1", message_id="m1", conversation_id=conversation_id, chunk_index=0,
+        audio_data="QUJD", is_final=True, created_at=None,
+    )
+
+
+def test_bundles_stay_inside_archive_dir(tmp_path):
+    archive = tmp_path / "archive"
+    maintenance = AudioMaintenance(RetentionPolicy(archive_dir=str(archive)))
+    bundles = maintenance._write_bundles([chunk("../escaped"), chunk("0b4ec0a1-plain-id")])
+
+    assert not (tmp_path / "escaped.ndjson.gz").exists()
+    assert os.path.dirname(bundles["../escaped"]) == str(archive)
+    assert bundles["0b4ec0a1-plain-id"] == str(archive / "0b4ec0a1-plain-id.ndjson.gz")
+    with gzip.open(bundles["../escaped"], "rt") as bundle:
+        assert '"conversation_id":"../escaped"' in bundle.read().replace(" ", "")
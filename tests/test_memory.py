@@ -0,0 +1,106 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+from app.memory import ConversationMemory, HashEmbedder
+
+CONVERSATION = "conversation-1"
+
+
+@pytest.fixture
+def memory(tmp_path):
+    return ConversationMemory(str(tmp_path), HashEmbedder(dim=64), top_k=2, min_score=0.1)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def remember_all(memory, messages):
+    assert await memory.remember(CONVERSATION, messages)
+
+
+def test_recall_returns_most_similar_first(memory):
+    run(remember_all(memory, [
+        ("m1", "the cat sat on the mat"),
+        ("m2", "quarterly revenue grew in europe"),
+        ("m3", "my cat likes the mat and the sofa"),
+    ]))
+    assert memory.count(CONVERSATION) == 3
+    assert run(memory.recall(CONVERSATION, "where does the cat sit on the mat")) == ["m1", "m3"]
+
+
+def test_recall_skips_excluded_ids(memory):
+    run(remember_all(memory, [
+        ("m1", "the cat sat on the mat"),
+        ("m2", "quarterly revenue grew in europe"),
+        ("m3", "my cat likes the mat and the sofa"),
+    ]))
+    assert run(memory.recall(CONVERSATION, "cat on the mat", exclude=["m1"])) == ["m3"]
+
+
+def test_remembering_a_message_twice_stores_it_once(memory):
+    run(remember_all(memory, [("m1", "the cat sat on the mat")]))
+    run(remember_all(memory, [("m1", "the cat sat on the mat"), ("m2", "revenue grew")]))
+    assert memory.count(CONVERSATION) == 2
+    size = os.path.getsize(memory._path(CONVERSATION, "vectors.f16"))
+    assert size == 2 * 64 * 2
+
+
+def test_interrupted_append_does_not_shift_rows(memory):
+    run(remember_all(memory, [("m1", "the cat sat on the mat")]))
+    # Crash between the two writes: a vector row without an id, then a half-written id
+    with open(memory._path(CONVERSATION, "vectors.f16"), "ab") as f:
+        f.write(np.ones(64, dtype=np.float16).tobytes())
+    with open(memory._path(CONVERSATION, "ids.txt"), "a") as f:
+        f.write("orph")
+    assert memory.count(CONVERSATION) == 1
+
+    run(remember_all(memory, [("m2", "quarterly revenue grew in europe")]))
+    assert memory._read_ids(CONVERSATION) == ["m1", "m2"]
+    assert os.path.getsize(memory._path(CONVERSATION, "vectors.f16")) == 2 * 64 * 2
+    assert run(memory.recall(CONVERSATION, "revenue in europe"))[0] == "m2"
+    assert run(memory.recall(CONVERSATION, "cat on the mat"))[0] == "m1"
+
+
+def test_backfill_runs_once_while_pending(memory):
+    calls = []
+    embed = memory.embedder.embed
+
+    async def counting_embed(texts):
+        calls.append(len(texts))
+        await asyncio.sleep(0.01)
+        return await embed(texts)
+
+    memory.embedder.embed = counting_embed
+    history = [("m1", "the cat sat on the mat"), ("m2", "revenue grew")]
+
+    async def turns():
+        memory.backfill_background(CONVERSATION, history)
+        memory.backfill_background(CONVERSATION, history)
+        await asyncio.gather(*memory._tasks)
+
+    run(turns())
+    assert calls == [2]
+    assert memory.count(CONVERSATION) == 2
+
+
+def test_failed_backfill_is_not_retried_every_turn(memory):
+    calls = []
+
+    async def failing_embed(texts):
+        calls.append(len(texts))
+        raise RuntimeError("model not found")
+
+    memory.embedder.embed = failing_embed
+
+    async def turns():
+        for _ in range(3):
+            memory.backfill_background(CONVERSATION, [("m1", "the cat sat on the mat")])
+            await asyncio.gather(*memory._tasks)
+
+    run(turns())
+    assert calls == [1]
+    assert memory.count(CONVERSATION) == 0
@@ -0,0 +1,102 @@
+import asyncio
+import sys
+import time
+import types
+
+import pytest
+
+from app.health import CircuitBreaker
+from app.tts_service import TTSService
+
+
+class HangingCommunicate:
+    """edge_tts.Communicate stand-in whose stream never produces audio."""
+
+    def __init__(self, text, voice):
+        pass
+
+    async def stream(self):
+        await asyncio.sleep(3600)
+        yield {"type": "audio", "data": b""}
+
+
+@pytest.fixture
+def hanging_edge_tts(monkeypatch):
+    monkeypatch.setitem(sys.modules, "edge_tts", types.SimpleNamespace(Communicate=HangingCommunicate))
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker("tts", reset_timeout=0.0)
+    breaker.state = "open"
+    breaker.opened_at = time.monotonic() - 1
+    return breaker
+
+
+def collect(generator):
+    async def run():
+        return [item async for item in generator]
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_open_circuit_still_yields_text(streaming):
+    service = TTSService(breaker=CircuitBreaker("tts"), streaming=streaming)
+    service.breaker.state = "open"
+    service.breaker.opened_at = time.monotonic()
+    items = collect(service.stream_text_to_speech("Hello there. Bye now."))
+    assert [(item["text"], item["audio_data"], item["is_final"]) for item in items] == [
+        ("Hello there.", None, False),
+        ("Bye now.", None, True),
+    ]
+
+
+def test_cancelled_trial_releases_the_breaker(hanging_edge_tts):
+    service = TTSService(breaker=half_open_breaker())
+
+    async def run():
+        task = asyncio.ensure_future(service.text_to_speech_chunk("Hello."))
+        await asyncio.sleep(0.01)
+        assert not service.breaker.available()  # Trial in flight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert service.breaker.state == "half_open"
+    assert service.breaker.allow()
+
+
+def test_cancelled_streaming_trial_releases_the_breaker(hanging_edge_tts):
+    service = TTSService(breaker=half_open_breaker(), streaming=True)
+
+    async def run():
+        pieces = service.stream_sentence_audio("Hello.")
+        task = asyncio.ensure_future(pieces.__anext__())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await pieces.aclose()
+
+    asyncio.run(run())
+    assert service.breaker.allow()
+
+
+def test_cancelled_scheduled_stream_leaves_no_pending_get(hanging_edge_tts):
+    from app.tts_scheduler import TTSScheduler
+
+    service = TTSService(breaker=CircuitBreaker("tts"), scheduler=TTSScheduler(1), streaming=True)
+
+    async def run():
+        pieces = service._scheduled_sentence_stream("Hello.", None, 0.0, True)
+        task = asyncio.ensure_future(pieces.__anext__())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await pieces.aclose()
+        await asyncio.sleep(0)
+        return [task for task in asyncio.all_tasks()
+                if not task.done() and task.get_coro().__qualname__ == "Queue.get"]
+
+    assert asyncio.run(run()) == []